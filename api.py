@@ -3,8 +3,12 @@
 Simple API interface for the ask() function
 """
 
-from flask import Flask, request, jsonify
-from util import ask, ask_with_sources
+from flask import Flask, g, request, jsonify
+from util import answer_query, ask_in_session, get_registered_retriever, validate_answer_options
+from sessions import session_store
+from jobs import job_manager
+from ratelimit import QueueFullError, client_id, rate_limiter, request_cost, stats as ratelimit_stats
+from prefork import per_worker_feature
 import logging
 
 # Configure logging
@@ -13,11 +17,60 @@ logger = logging.getLogger(__name__)
 
 app = Flask(__name__)
 
+@app.before_request
+def enforce_rate_limit():
+    """Identify the caller (X-API-Key or IP) and apply its token bucket"""
+    g.client_id = client_id(request.headers.get('X-API-Key'), request.remote_addr)
+    cost = request_cost(request.method, request.path)
+    if cost:
+        allowed, retry_after = rate_limiter.check(g.client_id, cost)
+        if not allowed and retry_after is None:
+            # Retrying cannot help: the request costs more than the bucket holds
+            return jsonify({"error": f"Request costs {cost:g} tokens, more than the rate limit burst allows"}), 403
+        if not allowed:
+            response = jsonify({"error": "Rate limit exceeded", "retry_after": round(retry_after, 2)})
+            response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+            return response, 429
+
+@app.before_request
+def refuse_per_worker_state():
+    """Refuse jobs, index_id and sessions when prefork runs several workers (see prefork.py)"""
+    index_id = request.args.get('index_id') or (request.get_json(silent=True) or {}).get('index_id')
+    feature = per_worker_feature(request.path, index_id)
+    if feature:
+        return jsonify({"error": f"{feature} not available with multiple prefork workers; run a single process"}), 501
+
+def _busy_response(error):
+    """503 for a request rejected by a fair queue (see ratelimit.py)"""
+    response = jsonify({"error": str(error), "retry_after": error.retry_after})
+    response.headers['Retry-After'] = str(max(1, int(error.retry_after + 0.999)))
+    return response, 503
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({"status": "healthy", "message": "Resume Q&A API is running"})
 
+def _answer_response(query, result, include_sources):
+    """Build the JSON body for an answer produced by answer_query()"""
+    response = {
+        "answer": result["answer"],
+        "query": query,
+        "model": result["model"],
+        "requested_model": result["requested_model"],
+        "route": result["route"]
+    }
+    if include_sources:
+        # Format source documents
+        response["sources"] = [
+            {
+                "content": source.page_content,
+                "metadata": source.metadata if hasattr(source, 'metadata') else {}
+            }
+            for source in result["sources"]
+        ]
+    return response
+
 @app.route('/ask', methods=['POST'])
 def ask_question():
     """Ask a question about the resume"""
@@ -28,38 +81,34 @@ def ask_question():
             return jsonify({"error": "Missing 'query' parameter"}), 400
         
         query = data['query']
-        model = data.get('model', 'llama3')
+        model = data.get('model', 'auto')
+        slo_ms = data.get('slo_ms')
+        answer_mode = data.get('answer_mode', 'auto')
         file_path = data.get('file_path', 'AS_KB.txt')
         include_sources = data.get('include_sources', False)
+        index_id = data.get('index_id')
+        
+        try:
+            slo_ms = validate_answer_options(model, slo_ms, answer_mode)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        retriever = None
+        if index_id:
+            try:
+                retriever = get_registered_retriever(index_id)
+            except KeyError:
+                return jsonify({"error": f"Unknown index_id '{index_id}'"}), 404
         
         logger.info(f"Processing query: {query}")
         
-        if include_sources:
-            answer, sources = ask_with_sources(query, file_path=file_path, model=model)
-            
-            # Format source documents
-            formatted_sources = []
-            for source in sources:
-                formatted_sources.append({
-                    "content": source.page_content,
-                    "metadata": source.metadata if hasattr(source, 'metadata') else {}
-                })
-            
-            return jsonify({
-                "answer": answer,
-                "sources": formatted_sources,
-                "query": query,
-                "model": model
-            })
-        else:
-            answer = ask(query, file_path=file_path, model=model)
-            
-            return jsonify({
-                "answer": answer,
-                "query": query,
-                "model": model
-            })
+        result = answer_query(query, retriever=retriever, file_path=file_path, model=model, slo_ms=slo_ms, answer_mode=answer_mode,
+                              client_id=g.client_id)
+        logger.info(f"Answer served by {result['model']} ({result['route']})")
+        return jsonify(_answer_response(query, result, include_sources))
     
+    except QueueFullError as e:
+        return _busy_response(e)
     except Exception as e:
         logger.error(f"Error processing query: {str(e)}")
         return jsonify({"error": str(e)}), 500
@@ -68,51 +117,152 @@ def ask_question():
 def ask_question_get():
     """Ask a question via GET request (for simple testing)"""
     query = request.args.get('q')
-    model = request.args.get('model', 'llama3')
+    model = request.args.get('model', 'auto')
+    slo_ms = request.args.get('slo_ms')
+    answer_mode = request.args.get('answer_mode', 'auto')
     include_sources = request.args.get('sources', 'false').lower() == 'true'
+    index_id = request.args.get('index_id')
     
     if not query:
         return jsonify({"error": "Missing 'q' parameter"}), 400
+    try:
+        slo_ms = validate_answer_options(model, slo_ms, answer_mode)
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    
+    retriever = None
+    if index_id:
+        try:
+            retriever = get_registered_retriever(index_id)
+        except KeyError:
+            return jsonify({"error": f"Unknown index_id '{index_id}'"}), 404
     
     try:
         logger.info(f"Processing GET query: {query}")
         
-        if include_sources:
-            answer, sources = ask_with_sources(query, model=model)
-            
-            # Format source documents
-            formatted_sources = []
-            for source in sources:
-                formatted_sources.append({
-                    "content": source.page_content,
-                    "metadata": source.metadata if hasattr(source, 'metadata') else {}
-                })
-            
-            return jsonify({
-                "answer": answer,
-                "sources": formatted_sources,
-                "query": query,
-                "model": model
-            })
-        else:
-            answer = ask(query, model=model)
-            
-            return jsonify({
-                "answer": answer,
-                "query": query,
-                "model": model
-            })
+        result = answer_query(query, retriever=retriever, model=model, slo_ms=slo_ms, answer_mode=answer_mode,
+                              client_id=g.client_id)
+        logger.info(f"Answer served by {result['model']} ({result['route']})")
+        return jsonify(_answer_response(query, result, include_sources))
     
+    except QueueFullError as e:
+        return _busy_response(e)
     except Exception as e:
         logger.error(f"Error processing GET query: {str(e)}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/session/ask', methods=['POST'])
+def ask_in_conversation():
+    """Ask a question within a conversation; omit 'session_id' to start one"""
+    try:
+        data = request.get_json()
+        
+        if not data or 'query' not in data:
+            return jsonify({"error": "Missing 'query' parameter"}), 400
+        
+        query = data['query']
+        session_id = data.get('session_id')
+        model = data.get('model', 'auto')
+        slo_ms = data.get('slo_ms')
+        answer_mode = data.get('answer_mode', 'auto')
+        file_path = data.get('file_path', 'AS_KB.txt')
+        include_sources = data.get('include_sources', False)
+        index_id = data.get('index_id')
+        
+        try:
+            slo_ms = validate_answer_options(model, slo_ms, answer_mode)
+        except ValueError as e:
+            return jsonify({"error": str(e)}), 400
+        
+        retriever = None
+        if index_id:
+            try:
+                retriever = get_registered_retriever(index_id)
+            except KeyError:
+                return jsonify({"error": f"Unknown index_id '{index_id}'"}), 404
+        
+        logger.info(f"Processing session query: {query}")
+        
+        result = ask_in_session(session_id, query, retriever=retriever, file_path=file_path, model=model, slo_ms=slo_ms,
+                                answer_mode=answer_mode, client_id=g.client_id)
+        response = _answer_response(query, result, include_sources)
+        response["session_id"] = result["session_id"]
+        response["reused_context"] = result["reused_context"]
+        return jsonify(response)
+    
+    except QueueFullError as e:
+        return _busy_response(e)
+    except Exception as e:
+        logger.error(f"Error processing session query: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/session/<session_id>', methods=['GET'])
+def get_conversation(session_id):
+    """Get a conversation's status"""
+    session = session_store.get(session_id)
+    if session is None:
+        return jsonify({"error": f"Unknown session '{session_id}'"}), 404
+    return jsonify(session.to_dict())
+
+@app.route('/session/<session_id>', methods=['DELETE'])
+def end_conversation(session_id):
+    """End a conversation and drop its context"""
+    if not session_store.delete(session_id):
+        return jsonify({"error": f"Unknown session '{session_id}'"}), 404
+    return jsonify({"session_id": session_id, "deleted": True})
+
+@app.route('/jobs', methods=['POST'])
+def create_ingestion_job():
+    """Queue a resume for background ingestion (multipart 'file' or JSON 'file_path')"""
+    try:
+        if 'file' in request.files:
+            job = job_manager.submit_upload(request.files['file'], client_id=g.client_id)
+        else:
+            data = request.get_json(silent=True) or {}
+            if 'file_path' not in data:
+                return jsonify({"error": "Missing 'file' upload or 'file_path' parameter"}), 400
+            job = job_manager.submit(data['file_path'], client_id=g.client_id)
+        
+        return jsonify(job.to_dict()), 202
+    
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except ValueError as e:
+        return jsonify({"error": str(e)}), 400
+    except Exception as e:
+        logger.error(f"Error creating ingestion job: {str(e)}")
+        return jsonify({"error": str(e)}), 500
+
+@app.route('/jobs/<job_id>', methods=['GET'])
+def get_ingestion_job(job_id):
+    """Poll an ingestion job; 'wait' long-polls for up to that many seconds"""
+    try:
+        wait = min(float(request.args.get('wait', 0)), 60.0)
+        since = request.args.get('since')
+        since = int(since) if since is not None else None
+    except ValueError:
+        return jsonify({"error": "'wait' must be a number of seconds and 'since' an integer version"}), 400
+    snapshot = job_manager.wait(job_id, since_version=since, timeout=wait)
+    if snapshot is None:
+        return jsonify({"error": f"Unknown job '{job_id}'"}), 404
+    return jsonify(snapshot)
+
+@app.route('/stats', methods=['GET'])
+def get_stats():
+    """Rate limits and generation / index build queue depths"""
+    return jsonify(ratelimit_stats())
+
 if __name__ == '__main__':
     print("🚀 Starting Resume Q&A API...")
     print("📝 Available endpoints:")
     print("  - GET  /health - Health check")
     print("  - POST /ask    - Ask question (JSON body)")
     print("  - GET  /ask    - Ask question (query parameter)")
+    print("  - POST /session/ask - Ask within a conversation (JSON body with session_id)")
+    print("  - GET  /session/<id> - Conversation status; DELETE to end it")
+    print("  - POST /jobs   - Upload a resume for background ingestion")
+    print("  - GET  /jobs/<id> - Poll ingestion progress")
+    print("  - GET  /stats  - Rate limits and queue depths")
     print("\n💡 Example usage:")
     print("  curl -X POST http://localhost:5000/ask \\")
     print("    -H 'Content-Type: application/json' \\")
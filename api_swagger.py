@@ -3,9 +3,16 @@
 Resume Q&A API with Swagger/OpenAPI documentation
 """
 
-from flask import Flask, request, jsonify
+from flask import Flask, g, request, jsonify
 from flask_restx import Api, Resource, fields
-from util import ask, ask_with_sources
+from util import ANSWER_MODES, MODEL_CHOICES, answer_query, ask_in_session, get_registered_retriever, validate_answer_options
+from sessions import session_store
+from router import model_router
+from jobs import job_manager
+from ratelimit import QueueFullError, client_id, rate_limiter, request_cost, stats as ratelimit_stats
+from prefork import per_worker_feature
+from werkzeug.datastructures import FileStorage
+from werkzeug.exceptions import HTTPException
 import logging
 from http import HTTPStatus
 
@@ -26,18 +33,53 @@ api = Api(app,
 # Define namespaces
 ns = api.namespace('api', description='Resume Q&A operations')
 
+@app.before_request
+def enforce_rate_limit():
+    """Identify the caller (X-API-Key or IP) and apply its token bucket"""
+    g.client_id = client_id(request.headers.get('X-API-Key'), request.remote_addr)
+    cost = request_cost(request.method, request.path)
+    if cost:
+        allowed, retry_after = rate_limiter.check(g.client_id, cost)
+        if not allowed and retry_after is None:
+            # Retrying cannot help: the request costs more than the bucket holds
+            return jsonify({'message': f'Request costs {cost:g} tokens, more than the rate limit burst allows'}), 403
+        if not allowed:
+            response = jsonify({'message': 'Rate limit exceeded', 'retry_after': round(retry_after, 2)})
+            response.headers['Retry-After'] = str(max(1, int(retry_after + 0.999)))
+            return response, 429
+
+@app.before_request
+def refuse_per_worker_state():
+    """Refuse jobs, index_id and sessions when prefork runs several workers (see prefork.py)"""
+    index_id = request.args.get('index_id') or (request.get_json(silent=True) or {}).get('index_id')
+    feature = per_worker_feature(request.path, index_id)
+    if feature:
+        return jsonify({'message': f'{feature} not available with multiple prefork workers; run a single process'}), 501
+
+@api.errorhandler(QueueFullError)
+def handle_queue_full(error):
+    """A fair queue (generation or index build) is saturated; ask the client to retry"""
+    return {'message': str(error), 'retry_after': error.retry_after}, 503, {
+        'Retry-After': str(max(1, int(error.retry_after + 0.999)))
+    }
+
 # Define models for Swagger documentation
 question_model = api.model('Question', {
     'query': fields.String(required=True, description='The question to ask about the resume'),
-    'model': fields.String(description='AI model to use (llama3, llama2, mistral, codellama)', default='llama3'),
+    'model': fields.String(description='AI model to use; "auto" lets the router pick', enum=list(MODEL_CHOICES), default='auto'),
+    'answer_mode': fields.String(description='generate (LLM), extractive (sentences from the top chunks, no LLM) or auto (extractive when confident enough)', default='auto'),
+    'slo_ms': fields.Float(description='Latency budget in milliseconds; the router falls back to a faster model or a cached answer to meet it'),
     'file_path': fields.String(description='Path to resume file', default='AS_KB.txt'),
-    'include_sources': fields.Boolean(description='Include source documents in response', default=False)
+    'include_sources': fields.Boolean(description='Include source documents in response', default=False),
+    'index_id': fields.String(description='Query an index produced by an ingestion job instead of file_path')
 })
 
 answer_model = api.model('Answer', {
     'answer': fields.String(description='The answer to the question'),
     'query': fields.String(description='The original question'),
-    'model': fields.String(description='The AI model used'),
+    'model': fields.String(description='What served the answer: a model name, "cache:<model>" or "extractive"'),
+    'requested_model': fields.String(description='The model requested by the client'),
+    'route': fields.String(description='Why the router chose this model'),
     'sources': fields.List(fields.Raw, description='Source documents (if requested)')
 })
 
@@ -45,12 +87,61 @@ error_model = api.model('Error', {
     'error': fields.String(description='Error message')
 })
 
+session_question_model = api.inherit('SessionQuestion', question_model, {
+    'session_id': fields.String(description='Conversation to continue; omit to start a new one')
+})
+
+session_answer_model = api.inherit('SessionAnswer', answer_model, {
+    'session_id': fields.String(description='Conversation id to send with the next question'),
+    'reused_context': fields.Boolean(description='Whether the previous turn\'s chunks were reused')
+})
+
+session_model = api.model('Session', {
+    'session_id': fields.String(description='Conversation id'),
+    'turns': fields.Integer(description='Questions asked so far'),
+    'history_tokens': fields.Integer(description='Approximate size of the rolling history'),
+    'created_at': fields.Float(description='Creation time (epoch seconds)'),
+    'last_access': fields.Float(description='Last use (epoch seconds); idle sessions expire')
+})
+
+job_model = api.model('IngestionJob', {
+    'job_id': fields.String(description='Job identifier'),
+    'file_path': fields.String(description='File being ingested'),
+    'status': fields.String(description='queued, running, succeeded or failed'),
+    'stage': fields.String(description='Current stage: extract, split, embed or index'),
+    'progress': fields.Float(description='Overall progress between 0 and 1'),
+    'error': fields.String(description='Error message if the job failed'),
+    'index_id': fields.String(description='Index id to query once the job has succeeded'),
+    'created_at': fields.Float(description='Creation time (epoch seconds)'),
+    'updated_at': fields.Float(description='Last update time (epoch seconds)'),
+    'version': fields.Integer(description='Change counter, pass as "since" to long-poll for updates')
+})
+
+job_upload_parser = api.parser()
+job_upload_parser.add_argument('file', location='files', type=FileStorage, required=True, help='Resume file (.pdf or .txt)')
+
 health_model = api.model('Health', {
     'status': fields.String(description='Service status'),
     'message': fields.String(description='Service message'),
     'version': fields.String(description='API version')
 })
 
+def _resolve_retriever(index_id):
+    """Return the registered retriever for index_id, or None to use file_path"""
+    if not index_id:
+        return None
+    try:
+        return get_registered_retriever(index_id)
+    except KeyError:
+        api.abort(404, f'Unknown index_id "{index_id}"')
+
+def _validate_options(model, slo_ms, answer_mode):
+    """Return slo_ms as a float (or None), aborting with 400 on an invalid option"""
+    try:
+        return validate_answer_options(model, slo_ms, answer_mode)
+    except ValueError as e:
+        api.abort(400, str(e))
+
 @ns.route('/health')
 class HealthCheck(Resource):
     @ns.doc('health_check')
@@ -63,12 +154,35 @@ class HealthCheck(Resource):
             'version': '1.0'
         }
 
+def _answer_response(query, result, include_sources):
+    """Build the response body for an answer produced by answer_query()"""
+    sources = []
+    if include_sources:
+        # Format source documents
+        sources = [
+            {
+                "content": source.page_content,
+                "metadata": source.metadata if hasattr(source, 'metadata') else {}
+            }
+            for source in result["sources"]
+        ]
+    return {
+        "answer": result["answer"],
+        "sources": sources,
+        "query": query,
+        "model": result["model"],
+        "requested_model": result["requested_model"],
+        "route": result["route"]
+    }
+
 @ns.route('/ask')
 class AskQuestion(Resource):
     @ns.doc('ask_question_post')
     @ns.expect(question_model)
     @ns.marshal_with(answer_model)
     @ns.response(400, 'Bad Request', error_model)
+    @ns.response(429, 'Rate limit exceeded (see Retry-After)', error_model)
+    @ns.response(503, 'Generation or index build queue full (see Retry-After)', error_model)
     @ns.response(500, 'Internal Server Error', error_model)
     def post(self):
         """Ask a question about the resume (POST)"""
@@ -79,39 +193,23 @@ class AskQuestion(Resource):
                 api.abort(400, 'Missing "query" parameter')
             
             query = data['query']
-            model = data.get('model', 'llama3')
+            model = data.get('model', 'auto')
+            slo_ms = data.get('slo_ms')
+            answer_mode = data.get('answer_mode', 'auto')
             file_path = data.get('file_path', 'AS_KB.txt')
             include_sources = data.get('include_sources', False)
+            slo_ms = _validate_options(model, slo_ms, answer_mode)
+            retriever = _resolve_retriever(data.get('index_id'))
             
             logger.info(f"Processing POST query: {query}")
             
-            if include_sources:
-                answer, sources = ask_with_sources(query, file_path=file_path, model=model)
-                
-                # Format source documents
-                formatted_sources = []
-                for source in sources:
-                    formatted_sources.append({
-                        "content": source.page_content,
-                        "metadata": source.metadata if hasattr(source, 'metadata') else {}
-                    })
-                
-                return {
-                    "answer": answer,
-                    "sources": formatted_sources,
-                    "query": query,
-                    "model": model
-                }
-            else:
-                answer = ask(query, file_path=file_path, model=model)
-                
-                return {
-                    "answer": answer,
-                    "query": query,
-                    "model": model,
-                    "sources": []
-                }
+            result = answer_query(query, retriever=retriever, file_path=file_path, model=model, slo_ms=slo_ms, answer_mode=answer_mode,
+                                  client_id=g.client_id)
+            logger.info(f"Answer served by {result['model']} ({result['route']})")
+            return _answer_response(query, result, include_sources)
         
+        except (HTTPException, QueueFullError):
+            raise
         except Exception as e:
             logger.error(f"Error processing POST query: {str(e)}")
             api.abort(500, str(e))
@@ -120,54 +218,143 @@ class AskQuestion(Resource):
 class AskQuestionGet(Resource):
     @ns.doc('ask_question_get')
     @ns.param('q', 'The question to ask', required=True)
-    @ns.param('model', 'AI model to use', enum=['llama3', 'llama2', 'mistral', 'codellama'], default='llama3')
+    @ns.param('model', 'AI model to use ("auto" lets the router pick)', enum=list(MODEL_CHOICES), default='auto')
+    @ns.param('slo_ms', 'Latency budget in milliseconds', type=float)
+    @ns.param('answer_mode', 'generate, extractive, or auto (extractive when confident)', enum=list(ANSWER_MODES), default='auto')
     @ns.param('sources', 'Include source documents', type=bool, default=False)
+    @ns.param('index_id', 'Query an index produced by an ingestion job')
     @ns.marshal_with(answer_model)
     @ns.response(400, 'Bad Request', error_model)
+    @ns.response(429, 'Rate limit exceeded (see Retry-After)', error_model)
+    @ns.response(503, 'Generation or index build queue full (see Retry-After)', error_model)
     @ns.response(500, 'Internal Server Error', error_model)
     def get(self):
         """Ask a question about the resume (GET)"""
         query = request.args.get('q')
-        model = request.args.get('model', 'llama3')
+        model = request.args.get('model', 'auto')
+        slo_ms = request.args.get('slo_ms')
+        answer_mode = request.args.get('answer_mode', 'auto')
         include_sources = request.args.get('sources', 'false').lower() == 'true'
         
         if not query:
             api.abort(400, 'Missing "q" parameter')
+        slo_ms = _validate_options(model, slo_ms, answer_mode)
+        
+        retriever = _resolve_retriever(request.args.get('index_id'))
         
         try:
             logger.info(f"Processing GET query: {query}")
             
-            if include_sources:
-                answer, sources = ask_with_sources(query, model=model)
-                
-                # Format source documents
-                formatted_sources = []
-                for source in sources:
-                    formatted_sources.append({
-                        "content": source.page_content,
-                        "metadata": source.metadata if hasattr(source, 'metadata') else {}
-                    })
-                
-                return {
-                    "answer": answer,
-                    "sources": formatted_sources,
-                    "query": query,
-                    "model": model
-                }
-            else:
-                answer = ask(query, model=model)
-                
-                return {
-                    "answer": answer,
-                    "query": query,
-                    "model": model,
-                    "sources": []
-                }
+            result = answer_query(query, retriever=retriever, model=model, slo_ms=slo_ms, answer_mode=answer_mode,
+                                  client_id=g.client_id)
+            logger.info(f"Answer served by {result['model']} ({result['route']})")
+            return _answer_response(query, result, include_sources)
         
+        except QueueFullError:
+            raise
         except Exception as e:
             logger.error(f"Error processing GET query: {str(e)}")
             api.abort(500, str(e))
 
+@ns.route('/sessions/ask')
+class SessionAsk(Resource):
+    @ns.doc('ask_in_session')
+    @ns.expect(session_question_model)
+    @ns.marshal_with(session_answer_model)
+    @ns.response(400, 'Bad Request', error_model)
+    @ns.response(429, 'Rate limit exceeded (see Retry-After)', error_model)
+    @ns.response(503, 'Generation or index build queue full (see Retry-After)', error_model)
+    @ns.response(500, 'Internal Server Error', error_model)
+    def post(self):
+        """Ask a question within a conversation (follow-ups keep context)"""
+        try:
+            data = request.get_json()
+            
+            if not data or 'query' not in data:
+                api.abort(400, 'Missing "query" parameter')
+            
+            query = data['query']
+            model = data.get('model', 'auto')
+            slo_ms = data.get('slo_ms')
+            answer_mode = data.get('answer_mode', 'auto')
+            file_path = data.get('file_path', 'AS_KB.txt')
+            include_sources = data.get('include_sources', False)
+            slo_ms = _validate_options(model, slo_ms, answer_mode)
+            retriever = _resolve_retriever(data.get('index_id'))
+            
+            logger.info(f"Processing session query: {query}")
+            
+            result = ask_in_session(data.get('session_id'), query, retriever=retriever, file_path=file_path, model=model, slo_ms=slo_ms,
+                                    answer_mode=answer_mode, client_id=g.client_id)
+            response = _answer_response(query, result, include_sources)
+            response['session_id'] = result['session_id']
+            response['reused_context'] = result['reused_context']
+            return response
+        
+        except (HTTPException, QueueFullError):
+            raise
+        except Exception as e:
+            logger.error(f"Error processing session query: {str(e)}")
+            api.abort(500, str(e))
+
+@ns.route('/sessions/<string:session_id>')
+class SessionResource(Resource):
+    @ns.doc('get_session')
+    @ns.marshal_with(session_model)
+    @ns.response(404, 'Session not found or expired', error_model)
+    def get(self, session_id):
+        """Get a conversation's status"""
+        session = session_store.get(session_id)
+        if session is None:
+            api.abort(404, f'Unknown session "{session_id}"')
+        return session.to_dict()
+    
+    @ns.doc('delete_session')
+    @ns.response(404, 'Session not found or expired', error_model)
+    def delete(self, session_id):
+        """End a conversation and drop its context"""
+        if not session_store.delete(session_id):
+            api.abort(404, f'Unknown session "{session_id}"')
+        return {'session_id': session_id, 'deleted': True}
+
+@ns.route('/jobs')
+class IngestionJobs(Resource):
+    @ns.doc('create_ingestion_job')
+    @ns.expect(job_upload_parser)
+    @ns.marshal_with(job_model, code=202)
+    @ns.response(400, 'Bad Request', error_model)
+    def post(self):
+        """Upload a resume for background ingestion; returns a job id to poll"""
+        args = job_upload_parser.parse_args()
+        try:
+            job = job_manager.submit_upload(args['file'], client_id=g.client_id)
+        except ValueError as e:
+            api.abort(400, str(e))
+        
+        logger.info(f"Queued ingestion job {job.id}")
+        return job.to_dict(), 202
+
+@ns.route('/jobs/<string:job_id>')
+class IngestionJobStatus(Resource):
+    @ns.doc('get_ingestion_job')
+    @ns.param('wait', 'Long-poll for up to this many seconds (max 60)', type=float, default=0)
+    @ns.param('since', 'Return as soon as the job version differs from this', type=int)
+    @ns.marshal_with(job_model)
+    @ns.response(400, 'Bad Request', error_model)
+    @ns.response(404, 'Job not found', error_model)
+    def get(self, job_id):
+        """Get the status and progress of an ingestion job"""
+        try:
+            wait = min(float(request.args.get('wait', 0)), 60.0)
+            since = request.args.get('since')
+            since = int(since) if since is not None else None
+        except ValueError:
+            api.abort(400, '"wait" must be a number of seconds and "since" an integer version')
+        snapshot = job_manager.wait(job_id, since_version=since, timeout=wait)
+        if snapshot is None:
+            api.abort(404, f'Unknown job "{job_id}"')
+        return snapshot
+
 @ns.route('/models')
 class AvailableModels(Resource):
     @ns.doc('get_models')
@@ -176,10 +363,15 @@ class AvailableModels(Resource):
         return {
             'models': [
                 {
-                    'name': 'llama3',
-                    'description': 'Latest Llama model (default)',
+                    'name': 'auto',
+                    'description': 'Router picks llama3, or mistral / a cached answer under load (default)',
                     'recommended': True
                 },
+                {
+                    'name': 'llama3',
+                    'description': 'Latest Llama model',
+                    'recommended': False
+                },
                 {
                     'name': 'llama2',
                     'description': 'Llama 2 model',
@@ -195,9 +387,19 @@ class AvailableModels(Resource):
                     'description': 'Code-focused Llama model',
                     'recommended': False
                 }
-            ]
+            ],
+            'routing': model_router.stats()
         }
 
+@ns.route('/stats')
+class Stats(Resource):
+    @ns.doc('get_stats')
+    def get(self):
+        """Get per-client rate limits and generation / index build queue depths"""
+        stats = ratelimit_stats()
+        stats['routing'] = model_router.stats()
+        return stats
+
 @ns.route('/examples')
 class ExampleQuestions(Resource):
     @ns.doc('get_examples')
@@ -225,6 +427,10 @@ if __name__ == '__main__':
     print("  - GET  /api/health - Health check")
     print("  - POST /api/ask - Ask question (JSON body)")
     print("  - GET  /api/ask - Ask question (query parameter)")
+    print("  - POST /api/sessions/ask - Ask within a conversation")
+    print("  - POST /api/jobs - Upload a resume for background ingestion")
+    print("  - GET  /api/stats - Rate limits and queue depths")
+    print("  - GET  /api/jobs/<id> - Poll ingestion progress")
     print("  - GET  /api/models - Available AI models")
     print("  - GET  /api/examples - Example questions")
     print("\n💡 Access Swagger UI at: http://localhost:5000/docs")
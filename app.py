@@ -1,8 +1,6 @@
 import streamlit as st
-from util import load_resume_and_create_retriever, ask, ask_with_sources
-from langchain.chains import RetrievalQA
-from langchain_community.llms import Ollama
-import requests
+from util import get_retriever, ask_in_session
+from outbox import contact_outbox
 from datetime import datetime
 
 st.set_page_config(page_title="Resume Q&A", layout="wide")
@@ -20,9 +18,8 @@ RECIPIENT_EMAIL = "atmin@example.com"  # Replace with Atmin's email
 
 
 def send_email_to_atmin(name, email, company, question, additional_info):
-    """Send email to Atmin with user's question and information via Formspree"""
+    """Queue the user's question for delivery to Atmin via Formspree (returns immediately)"""
     try:
-        FORMSPREE_ENDPOINT = "https://formspree.io/f/mzzvbpqn"  # Replace with your Formspree endpoint
         data = {
             "name": name,
             "email": email,
@@ -31,23 +28,26 @@ def send_email_to_atmin(name, email, company, question, additional_info):
             "additional_info": additional_info,
             "_subject": f"New Question for Atmin from {name} - {company}",
         }
-        response = requests.post(FORMSPREE_ENDPOINT, data=data)
-        if response.status_code == 200 or response.status_code == 202:
-            return True
-        else:
-            st.error(f"Failed to send email: {response.text}")
-            return False
+        # Delivered by a background worker with retries; see outbox.py
+        contact_outbox.enqueue(data)
+        return True
     except Exception as e:
-        st.error(f"Failed to send email: {str(e)}")
+        st.error(f"Failed to queue email: {str(e)}")
         return False
 
+# Resume delivery of any submissions left pending by a previous run
+contact_outbox.start()
+
 # Initialize session state for chat history
 if "chat_history" not in st.session_state:
     st.session_state.chat_history = []
+# Server-side conversation context for follow-up questions
+if "session_id" not in st.session_state:
+    st.session_state.session_id = None
 
 try:
-    # Load resume and create retriever
-    retriever = load_resume_and_create_retriever(resume_path)
+    # Load resume and create retriever (cached across Streamlit reruns)
+    retriever = get_retriever(resume_path)
 
     # Create two columns for the interface
     col1, col2 = st.columns([2, 1])
@@ -59,8 +59,8 @@ try:
         # Chat input
         query = st.text_input("Enter your question", placeholder="e.g., What are Atmin's skills? What experience does he have?")
         
-        # Model selection
-        model = "llama3"
+        # Model selection ("auto" lets the router fall back to a faster model under load)
+        model = "auto"
         # Show sources option
         show_sources = st.checkbox("Show source documents", value=False)
         
@@ -68,30 +68,28 @@ try:
             if query.strip():
                 with st.spinner("🤔 Thinking..."):
                     try:
-                        if show_sources:
-                            answer, sources = ask_with_sources(query, retriever=retriever, model=model)
-                            
-                            # Display answer
-                            st.markdown("### 📄 Answer:")
-                            st.write(answer)
-                            
-                            # Display sources
-                            if sources:
-                                st.markdown("### 📚 Source Documents:")
-                                for i, source in enumerate(sources, 1):
-                                    with st.expander(f"Source {i}"):
-                                        st.write(source.page_content)
-                                        if hasattr(source, 'metadata'):
-                                            st.caption(f"Source: {source.metadata.get('source', 'Unknown')}")
-                        else:
-                            answer = ask(query, retriever=retriever, model=model)
-                            st.markdown("### 📄 Answer:")
-                            st.write(answer)
+                        result = ask_in_session(st.session_state.session_id, query, retriever=retriever, model=model)
+                        st.session_state.session_id = result["session_id"]
+                        answer = result["answer"]
+                        
+                        # Display answer
+                        st.markdown("### 📄 Answer:")
+                        st.write(answer)
+                        st.caption(f"Answered by {result['model']}")
+                        
+                        # Display sources
+                        if show_sources and result["sources"]:
+                            st.markdown("### 📚 Source Documents:")
+                            for i, source in enumerate(result["sources"], 1):
+                                with st.expander(f"Source {i}"):
+                                    st.write(source.page_content)
+                                    if hasattr(source, 'metadata'):
+                                        st.caption(f"Source: {source.metadata.get('source', 'Unknown')}")
                         
                         # Add to chat history
                         st.session_state.chat_history.append({
                             "question": query,
-                            "answer": answer if not show_sources else answer,
+                            "answer": answer,
                             "timestamp": datetime.now().strftime("%H:%M:%S")
                         })
                         
@@ -114,6 +112,7 @@ try:
             
             if st.button("🗑️ Clear Chat History"):
                 st.session_state.chat_history = []
+                st.session_state.session_id = None
                 st.rerun()
     
     with col2:
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Benchmark of compressed vector storage (quantize.py).
+
+For each storage setting, reports RAM per vector, memory saved against
+float32, and recall@k against exact float32 search, both straight from the
+compressed index and after exact re-scoring from the memory-mapped full
+vectors. Re-scored searches are run one query at a time, as the retriever
+issues them, and checked not to modify the query vectors.
+
+By default runs on synthetic unit vectors with a decaying per-dimension
+spectrum (Matryoshka-trained embeddings concentrate information in the
+leading dimensions the same way). Pass --vectors with a saved vectors.f32
+(from an index cache built with VECTOR_STORAGE set) or a .npy file to use
+real nomic-embed-text embeddings.
+
+Usage:
+    python benchmark_quantization.py [--n 100000] [--dim 768] [--k 10]
+    python benchmark_quantization.py --vectors .index_cache/<entry>/vectors.f32
+"""
+
+import argparse
+import time
+
+import faiss
+import numpy as np
+
+from quantize import FullVectorWriter, QuantizedIndex, VectorStorage, build_index, truncate
+
+CONFIGS = [
+    ("float32", None),
+    ("float16", None),
+    ("int8", None),
+    ("float32", 256),
+    ("float16", 256),
+    ("int8", 256),
+    ("int8", 128),
+]
+
+def synthetic_vectors(n, dim, clusters=256, seed=0):
+    """Clustered unit vectors whose variance decays along the dimensions."""
+    rng = np.random.default_rng(seed)
+    spectrum = (1.0 / np.sqrt(1.0 + np.arange(dim) / 32.0)).astype(np.float32)
+    centers = rng.standard_normal((clusters, dim)).astype(np.float32)
+    vectors = centers[rng.integers(clusters, size=n)] + 0.6 * rng.standard_normal((n, dim)).astype(np.float32)
+    vectors *= spectrum
+    faiss.normalize_L2(vectors)
+    return vectors
+
+def load_vectors(path, dim):
+    if path.endswith(".npy"):
+        return np.load(path, mmap_mode="r")
+    return np.memmap(path, dtype=np.float32, mode="r").reshape(-1, dim)
+
+def recall(found, truth):
+    """Fraction of the true top-k ids that were returned, averaged over queries."""
+    hits = sum(len(np.intersect1d(f[f != -1], t)) for f, t in zip(found, truth))
+    return hits / truth.size
+
+def main():
+    parser = argparse.ArgumentParser(description="Memory saved vs recall@k for compressed vector storage")
+    parser.add_argument("--n", type=int, default=100000, help="Synthetic vectors")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension (nomic-embed-text: 768)")
+    parser.add_argument("--vectors", help="Real vectors (.npy, or raw float32 .f32 with --dim)")
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--k", type=int, default=10)
+    parser.add_argument("--rescore-factor", type=int, default=10)
+    args = parser.parse_args()
+
+    vectors = load_vectors(args.vectors, args.dim) if args.vectors else synthetic_vectors(args.n, args.dim)
+    n, dim = vectors.shape
+    rng = np.random.default_rng(1)
+    # Queries near stored vectors, like questions about chunks that exist
+    queries = np.asarray(vectors[rng.choice(n, args.queries, replace=False)], dtype=np.float32)
+    queries = queries + 0.05 * rng.standard_normal(queries.shape).astype(np.float32)
+    faiss.normalize_L2(queries)
+
+    # Full vectors on disk, memory-mapped, as the retriever uses them
+    writer = FullVectorWriter()
+    for start in range(0, n, 65536):
+        writer.add(vectors[start:start + 65536])
+    full_vectors = writer.finish()
+
+    exact = faiss.IndexFlatL2(dim)
+    exact.add(np.ascontiguousarray(full_vectors))
+    _, truth = exact.search(queries, args.k)
+    baseline = 4 * dim
+
+    print(f"n={n} dim={dim} k={args.k} queries={args.queries} rescore_factor={args.rescore_factor}\n")
+    print(f"{'storage':<14} {'B/vector':>9} {'saved':>7} {'x in RAM':>9} {'recall':>7} {'rescored':>9} {'ms/query':>9}")
+    for dtype, dims in CONFIGS:
+        if dims and dims >= dim:
+            continue
+        storage = VectorStorage(dtype, dims, args.rescore_factor)
+        index = build_index(full_vectors, storage)
+        quantized = QuantizedIndex(index, full_vectors, storage)
+
+        _, coarse = index.search(truncate(queries, dims), args.k)
+        # One (1, dim) query per search, like ResumeRetriever
+        before = queries.copy()
+        start = time.perf_counter()
+        rescored = np.vstack([quantized.search(queries[i:i + 1], args.k)[1] for i in range(len(queries))])
+        elapsed = (time.perf_counter() - start) / len(queries)
+        if not np.array_equal(before, queries):
+            raise RuntimeError(f"{storage.cache_tag()}: search modified the query vectors")
+        _, batched = quantized.search(queries, args.k)
+        if not np.array_equal(batched, rescored):
+            raise RuntimeError(f"{storage.cache_tag()}: batched and single-query results differ")
+
+        per_vector = index.code_size
+        print(f"{storage.cache_tag():<14} {per_vector:>9} {1 - per_vector / baseline:>6.0%} "
+              f"{baseline / per_vector:>8.1f}x {recall(coarse, truth):>7.3f} {recall(rescored, truth):>9.3f} "
+              f"{elapsed * 1e3:>9.3f}")
+
+if __name__ == "__main__":
+    main()
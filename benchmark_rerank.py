@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+"""
+Benchmark of the re-ranking stage (rerank.py).
+
+For candidate pools of 10 to 10k random vectors, times fetching the
+candidate vectors from a flat FAISS index plus the vectorized re-rank,
+against the same MMR + dedup written as a Python loop over per-candidate
+Document objects, and checks that both pick the same chunks.
+
+Usage:
+    python benchmark_rerank.py [--dim 768] [--k 5] [--repeat 5]
+"""
+
+import argparse
+import time
+
+import faiss
+import numpy as np
+from langchain_core.documents import Document
+
+from rerank import candidate_vectors, rerank
+
+def rerank_loop(query_vector, documents, k, lambda_mult=0.5, dedup_threshold=0.95):
+    """Reference implementation: one Python object and one dot product at a time."""
+    query = query_vector / np.linalg.norm(query_vector)
+    for doc in documents:
+        vector = doc.metadata["vector"]
+        doc.metadata["unit"] = vector / np.linalg.norm(vector)
+        doc.metadata["relevance"] = float(np.dot(doc.metadata["unit"], query))
+
+    selected = []
+    remaining = list(range(len(documents)))
+    while remaining and len(selected) < k:
+        best, best_score = None, -np.inf
+        for i in remaining:
+            relevance = documents[i].metadata["relevance"]
+            if selected:
+                redundancy = max(float(np.dot(documents[i].metadata["unit"], documents[j].metadata["unit"]))
+                                 for j in selected)
+                score = lambda_mult * relevance - (1.0 - lambda_mult) * redundancy
+            else:
+                score = relevance
+            if score > best_score:
+                best, best_score = i, score
+        selected.append(best)
+        remaining = [
+            i for i in remaining
+            if i != best and float(np.dot(documents[i].metadata["unit"], documents[best].metadata["unit"])) < dedup_threshold
+        ]
+    return selected
+
+def best_of(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        times.append(time.perf_counter() - start)
+    return min(times), result
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark vectorized re-ranking against a per-Document loop")
+    parser.add_argument("--dim", type=int, default=768, help="Embedding dimension (nomic-embed-text: 768)")
+    parser.add_argument("--k", type=int, default=5, help="Chunks kept per query")
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"dim={args.dim} k={args.k}, best of {args.repeat}\n")
+    print(f"{'pool':>6} {'fetch ms':>9} {'rerank ms':>10} {'loop ms':>9} {'speedup':>8}  same picks")
+
+    for pool in (10, 100, 1000, 10000):
+        vectors = rng.standard_normal((pool, args.dim)).astype(np.float32)
+        # Make a tenth of the pool near-duplicates of other candidates, like overlapping chunks
+        dupes = rng.choice(pool, size=max(1, pool // 10), replace=False)
+        vectors[dupes] = vectors[(dupes + 1) % pool] + 0.01 * rng.standard_normal((len(dupes), args.dim))
+        query = vectors[0] + 0.5 * rng.standard_normal(args.dim).astype(np.float32)
+
+        index = faiss.IndexFlatL2(args.dim)
+        index.add(vectors)
+        ids = np.arange(pool, dtype=np.int64)
+        documents = [Document(page_content=f"chunk {i}", metadata={"vector": vectors[i]}) for i in range(pool)]
+
+        fetch_s, fetched = best_of(lambda: candidate_vectors(index, ids), args.repeat)
+        rerank_s, (picks, _) = best_of(lambda: rerank(query, fetched, args.k), args.repeat)
+        loop_s, loop_picks = best_of(lambda: rerank_loop(query, documents, args.k), max(1, args.repeat // 2))
+
+        same = list(picks) == loop_picks
+        speedup = loop_s / (fetch_s + rerank_s)
+        print(f"{pool:>6} {fetch_s * 1e3:>9.3f} {rerank_s * 1e3:>10.3f} {loop_s * 1e3:>9.1f} {speedup:>7.0f}x  {same}")
+
+if __name__ == "__main__":
+    main()
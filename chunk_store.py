@@ -0,0 +1,290 @@
+"""
+Compact columnar storage for indexed chunks.
+
+Instead of one LangChain Document (plus a metadata dict) per chunk, all
+chunk texts live in a single UTF-8 blob addressed by an offsets array, and
+metadata is stored column-wise: integer columns as int64 arrays, everything
+else interned into a small value table plus int32 codes. Documents are only
+materialized for the hits a search actually returns.
+
+A saved store is a directory of flat files that is memory-mapped on load,
+so startup does not pay for unpickling millions of Python objects.
+"""
+
+import json
+import os
+from array import array
+from collections.abc import Mapping
+
+import numpy as np
+
+READ_ONLY_MESSAGE = ("ChunkStore is read-only: chunks cannot be added or deleted in place. "
+                     "Re-index the file (util.load_resume_and_create_retriever) or build a "
+                     "new store with ChunkStoreBuilder.")
+
+_INT_MISSING = np.iinfo(np.int64).min
+_CODE_MISSING = -1
+
+class _Column:
+    """Append-only metadata column used while building a store."""
+
+    def __init__(self, count):
+        # Start as an int column; rows added before this column existed are missing
+        self.kind = "int"
+        self.ints = array("q", [_INT_MISSING] * count)
+        self.codes = None
+        self.values = None
+        self.lookup = None
+
+    def _to_interned(self):
+        self.kind = "interned"
+        self.values = []
+        self.lookup = {}
+        self.codes = array("i")
+        for value in self.ints:
+            self.codes.append(_CODE_MISSING if value == _INT_MISSING else self._intern(int(value)))
+        self.ints = None
+
+    def _intern(self, value):
+        code = self.lookup.get(value)
+        if code is None:
+            code = len(self.values)
+            self.values.append(value)
+            self.lookup[value] = code
+        return code
+
+    def append(self, value):
+        if value is None:
+            if self.kind == "int":
+                self.ints.append(_INT_MISSING)
+            else:
+                self.codes.append(_CODE_MISSING)
+            return
+        if self.kind == "int" and not (isinstance(value, int) and not isinstance(value, bool)):
+            self._to_interned()
+        if self.kind == "int":
+            self.ints.append(value)
+        else:
+            self.codes.append(self._intern(value))
+
+class ChunkStoreBuilder:
+    """
+    Accumulates chunks into columnar form.
+
+    If a directory is given, text is streamed to disk as it is added and the
+    finished store is memory-mapped from there, so building never holds the
+    whole corpus in memory.
+    """
+
+    def __init__(self, directory=None):
+        self.directory = directory
+        self._count = 0
+        self._offsets = array("q", [0])
+        self._columns = {}
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+            self._blob = open(os.path.join(directory, "text.bin"), "wb")
+        else:
+            self._blob = bytearray()
+
+    def __len__(self):
+        return self._count
+
+    def add(self, text, metadata=None):
+        """Append one chunk and return its row id."""
+        data = text.encode("utf-8")
+        if self.directory is not None:
+            self._blob.write(data)
+        else:
+            self._blob.extend(data)
+        self._offsets.append(self._offsets[-1] + len(data))
+
+        metadata = metadata or {}
+        for name in metadata:
+            if name not in self._columns:
+                self._columns[name] = _Column(self._count)
+        for name, column in self._columns.items():
+            column.append(metadata.get(name))
+
+        row = self._count
+        self._count += 1
+        return row
+
+    def add_documents(self, documents):
+        for doc in documents:
+            self.add(doc.page_content, doc.metadata)
+
+    def build(self):
+        """Finish the store. Returns a ChunkStore."""
+        offsets = np.frombuffer(self._offsets, dtype=np.int64).copy()
+        columns = {}
+        for name, column in self._columns.items():
+            if column.kind == "int":
+                columns[name] = ("int", None, np.frombuffer(column.ints, dtype=np.int64).copy())
+            else:
+                columns[name] = ("interned", list(column.values), np.frombuffer(column.codes, dtype=np.int32).copy())
+
+        if self.directory is None:
+            # A view of the blob, not a copy; the builder is done with it
+            return ChunkStore(np.frombuffer(self._blob, dtype=np.uint8), offsets, columns)
+
+        self._blob.close()
+        ChunkStore._write_columns(self.directory, offsets, columns)
+        return ChunkStore.load(self.directory)
+
+class ChunkStore:
+    """
+    Read-only columnar chunk store.
+
+    Implements the docstore interface used by LangChain's FAISS vector store
+    (search by id), with row numbers as ids; pair it with
+    ``index_to_docstore_id=store.id_map()``.
+    """
+
+    def __init__(self, blob, offsets, columns):
+        """
+        Args:
+            blob (np.ndarray): uint8 array with all chunk texts concatenated
+            offsets (np.ndarray): int64 array of len(store) + 1 byte offsets
+            columns (dict): name -> (kind, values, array) where kind is "int"
+                (array holds the values) or "interned" (array holds int32
+                codes into the values list)
+        """
+        self._blob = blob
+        self._offsets = offsets
+        self._columns = columns
+
+    @classmethod
+    def from_documents(cls, documents, directory=None):
+        builder = ChunkStoreBuilder(directory)
+        builder.add_documents(documents)
+        return builder.build()
+
+    def __len__(self):
+        return len(self._offsets) - 1
+
+    @property
+    def nbytes(self):
+        """Approximate memory footprint of the store's arrays."""
+        total = self._blob.nbytes + self._offsets.nbytes
+        for kind, values, data in self._columns.values():
+            total += data.nbytes
+        return total
+
+    def text(self, i):
+        start, end = self._offsets[i], self._offsets[i + 1]
+        return bytes(self._blob[start:end]).decode("utf-8")
+
+    def metadata(self, i):
+        result = {}
+        for name, (kind, values, data) in self._columns.items():
+            if kind == "int":
+                value = data[i]
+                if value != _INT_MISSING:
+                    result[name] = int(value)
+            else:
+                code = data[i]
+                if code != _CODE_MISSING:
+                    result[name] = values[code]
+        return result
+
+    def column(self, name):
+        """Return (kind, values, array) for a metadata column, or None."""
+        return self._columns.get(name)
+
+    def rows_where(self, name, value):
+        """Return the row ids whose metadata column equals value, as an int64 array."""
+        column = self._columns.get(name)
+        if column is None:
+            return np.empty(0, dtype=np.int64)
+        kind, values, data = column
+        if kind == "int":
+            return np.flatnonzero(data == value)
+        if value not in values:
+            return np.empty(0, dtype=np.int64)
+        return np.flatnonzero(data == values.index(value))
+
+    def document(self, i):
+        from langchain.schema import Document
+
+        return Document(page_content=self.text(i), metadata=self.metadata(i))
+
+    def id_map(self):
+        """Identity mapping from FAISS row to docstore id, without a per-row dict."""
+        return _IdentityIdMap(len(self))
+
+    # Docstore interface
+
+    def search(self, search):
+        i = int(search)
+        if not 0 <= i < len(self):
+            return f"ID {search} not found."
+        return self.document(i)
+
+    def add(self, texts):
+        raise TypeError(READ_ONLY_MESSAGE)
+
+    def delete(self, ids):
+        raise TypeError(READ_ONLY_MESSAGE)
+
+    # Persistence
+
+    def save(self, directory):
+        os.makedirs(directory, exist_ok=True)
+        with open(os.path.join(directory, "text.bin"), "wb") as f:
+            f.write(memoryview(self._blob))
+        self._write_columns(directory, self._offsets, self._columns)
+
+    @staticmethod
+    def _write_columns(directory, offsets, columns):
+        np.save(os.path.join(directory, "offsets.npy"), offsets)
+        meta = {"count": len(offsets) - 1, "columns": {}}
+        for i, (name, (kind, values, data)) in enumerate(columns.items()):
+            filename = f"column_{i}.npy"
+            np.save(os.path.join(directory, filename), data)
+            meta["columns"][name] = {"kind": kind, "values": values, "file": filename}
+        with open(os.path.join(directory, "meta.json"), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+
+    @classmethod
+    def load(cls, directory, mmap=True):
+        """
+        Load a store saved with save().
+
+        Args:
+            directory (str): Store directory
+            mmap (bool): Memory-map the arrays instead of reading them into RAM
+        """
+        mode = "r" if mmap else None
+        with open(os.path.join(directory, "meta.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        offsets = np.load(os.path.join(directory, "offsets.npy"), mmap_mode=mode)
+        blob_path = os.path.join(directory, "text.bin")
+        if os.path.getsize(blob_path) == 0:
+            blob = np.empty(0, dtype=np.uint8)
+        elif mmap:
+            blob = np.memmap(blob_path, dtype=np.uint8, mode="r")
+        else:
+            blob = np.fromfile(blob_path, dtype=np.uint8)
+        columns = {}
+        for name, info in meta["columns"].items():
+            data = np.load(os.path.join(directory, info["file"]), mmap_mode=mode)
+            columns[name] = (info["kind"], info["values"], data)
+        return cls(blob, offsets, columns)
+
+class _IdentityIdMap(Mapping):
+    """Read-only {row: row} mapping for FAISS.index_to_docstore_id."""
+
+    def __init__(self, count):
+        self._count = count
+
+    def __getitem__(self, key):
+        if isinstance(key, (int, np.integer)) and 0 <= key < self._count:
+            return int(key)
+        raise KeyError(key)
+
+    def __iter__(self):
+        return iter(range(self._count))
+
+    def __len__(self):
+        return self._count
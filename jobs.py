@@ -0,0 +1,213 @@
+"""
+Background ingestion jobs for resume files.
+
+Uploading a resume returns a job id immediately; a thread pool runs
+extraction, splitting, embedding and indexing in the background and
+registers the finished retriever so it can be queried by index id.
+Chunk texts are streamed into a per-job directory under JOB_INDEX_DIR and
+memory-mapped from there, so a large upload is never held in memory whole.
+Once more than max_finished_jobs jobs have finished, the oldest are
+forgotten together with their index, its directory and the uploaded file.
+"""
+
+import os
+import shutil
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from ratelimit import index_build_queue
+from util import load_resume_and_create_retriever, register_retriever, unregister_retriever
+
+UPLOAD_DIR = os.environ.get("RESUME_UPLOAD_DIR", "uploads")
+JOB_INDEX_DIR = os.environ.get("JOB_INDEX_DIR", ".job_indexes")
+
+class IngestionJob:
+    """State of a single ingestion job."""
+
+    def __init__(self, file_path, client_id=None, uploaded=False):
+        self.id = uuid.uuid4().hex
+        self.file_path = file_path
+        self.client_id = client_id
+        # Uploaded files belong to the job and are deleted with it
+        self.uploaded = uploaded
+        # Chunk texts (and full vectors for compressed storage) of the job's index
+        self.store_dir = os.path.join(JOB_INDEX_DIR, self.id)
+        self.status = "queued"
+        self.stage = None
+        self.progress = 0.0
+        self.error = None
+        self.index_id = None
+        self.created_at = time.time()
+        self.updated_at = self.created_at
+        # Bumped on every change so pollers can wait for "something new"
+        self.version = 0
+
+    @property
+    def done(self):
+        return self.status in ("succeeded", "failed")
+
+    def to_dict(self):
+        return {
+            "job_id": self.id,
+            "file_path": self.file_path,
+            "status": self.status,
+            "stage": self.stage,
+            "progress": round(self.progress, 3),
+            "error": self.error,
+            "index_id": self.index_id,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+            "version": self.version,
+        }
+
+class JobManager:
+    """
+    Runs ingestion jobs on a worker pool and tracks their progress.
+
+    Threads are used rather than processes: embedding is dominated by
+    waiting on Ollama, and the finished retriever has to live in this
+    process to be queried.
+    """
+
+    def __init__(self, max_workers=2, max_finished_jobs=1000):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        self._jobs = {}
+        self._max_finished_jobs = max_finished_jobs
+        self._cond = threading.Condition()
+
+    def submit(self, file_path, client_id=None):
+        """
+        Queue a file for ingestion.
+
+        Args:
+            file_path (str): Path to a .pdf or .txt file
+            client_id (str): Submitting client, for fair scheduling of index builds
+
+        Returns:
+            IngestionJob: The queued job
+        """
+        return self._submit(file_path, client_id)
+
+    def _submit(self, file_path, client_id=None, uploaded=False):
+        if not os.path.exists(file_path):
+            raise FileNotFoundError(f"File not found: {file_path}")
+        ext = os.path.splitext(file_path)[1].lower()
+        if ext not in (".pdf", ".txt"):
+            raise ValueError("Unsupported file type. Please upload a .pdf or .txt file.")
+
+        job = IngestionJob(file_path, client_id, uploaded)
+        with self._cond:
+            self._jobs[job.id] = job
+            pruned = self._prune_finished()
+        self._release(pruned)
+        self._executor.submit(self._run, job)
+        print(f"[INFO] Queued ingestion job {job.id} for {file_path}")
+        return job
+
+    def submit_upload(self, file_storage, client_id=None):
+        """
+        Save an uploaded file (werkzeug FileStorage) and queue it for ingestion.
+
+        Returns:
+            IngestionJob: The queued job
+        """
+        from werkzeug.utils import secure_filename
+
+        filename = secure_filename(file_storage.filename or "")
+        if not filename:
+            raise ValueError("Missing file name")
+        os.makedirs(UPLOAD_DIR, exist_ok=True)
+        path = os.path.join(UPLOAD_DIR, f"{uuid.uuid4().hex}_{filename}")
+        file_storage.save(path)
+        try:
+            return self._submit(path, client_id, uploaded=True)
+        except Exception:
+            os.remove(path)
+            raise
+
+    def get(self, job_id):
+        """Return the job with the given id, or None."""
+        with self._cond:
+            return self._jobs.get(job_id)
+
+    def wait(self, job_id, since_version=None, timeout=0.0):
+        """
+        Long-poll a job until it changes or finishes.
+
+        Args:
+            job_id (str): Job to wait on
+            since_version (int): Return as soon as the job's version differs
+                from this. If None, wait until the job finishes.
+            timeout (float): Maximum seconds to wait
+
+        Returns:
+            dict: Snapshot of the job, or None if the job does not exist
+        """
+        deadline = time.time() + max(0.0, timeout)
+        with self._cond:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return None
+            while not job.done and (since_version is None or job.version == since_version):
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    break
+                self._cond.wait(remaining)
+            return job.to_dict()
+
+    def _update(self, job, **changes):
+        with self._cond:
+            for name, value in changes.items():
+                setattr(job, name, value)
+            job.updated_at = time.time()
+            job.version += 1
+            self._cond.notify_all()
+
+    def _prune_finished(self):
+        """Drop the oldest finished jobs beyond max_finished_jobs; returns them."""
+        finished = [j for j in self._jobs.values() if j.done]
+        excess = len(finished) - self._max_finished_jobs
+        if excess <= 0:
+            return []
+        finished.sort(key=lambda j: j.updated_at)
+        for job in finished[:excess]:
+            del self._jobs[job.id]
+        return finished[:excess]
+
+    def _release(self, jobs):
+        """Free the index, its directory and the uploaded file of pruned jobs."""
+        for job in jobs:
+            if job.index_id is not None:
+                unregister_retriever(job.index_id)
+            # Queries still running on the index keep their memory maps
+            shutil.rmtree(job.store_dir, ignore_errors=True)
+            if job.uploaded:
+                try:
+                    os.remove(job.file_path)
+                except OSError as e:
+                    print(f"[WARNING] Could not delete upload {job.file_path}: {str(e)}")
+
+    def _run(self, job):
+        # Index builds share a budget with those triggered by /ask (see ratelimit.py);
+        # the job stays queued until it gets a slot
+        self._update(job, stage="waiting")
+
+        def on_progress(stage, fraction):
+            self._update(job, stage=stage, progress=fraction)
+
+        try:
+            with index_build_queue.slot(job.client_id or "local", timeout=float("inf")):
+                self._update(job, status="running", stage="extract")
+                retriever = load_resume_and_create_retriever(job.file_path, progress_callback=on_progress,
+                                                             store_dir=job.store_dir)
+            register_retriever(job.id, retriever)
+            self._update(job, status="succeeded", progress=1.0, index_id=job.id)
+            print(f"[INFO] Ingestion job {job.id} finished")
+        except Exception as e:
+            print(f"[ERROR] Ingestion job {job.id} failed: {str(e)}")
+            shutil.rmtree(job.store_dir, ignore_errors=True)
+            self._update(job, status="failed", error=str(e))
+
+job_manager = JobManager(max_workers=int(os.environ.get("INGEST_WORKERS", "2")))
@@ -0,0 +1,254 @@
+"""
+Durable outbox for "Ask Atmin" contact submissions.
+
+Submissions are written to a local SQLite table and the caller returns
+immediately; a background thread delivers them to the form endpoint over
+a pooled HTTP session with timeouts, retrying failures with exponential
+backoff. A submission identical to one still pending, or sent within the
+last few minutes (a double click or resubmit), is not stored again; later
+resubmissions are. Rows left pending by a crash or restart are picked up
+again on the next start.
+"""
+
+import hashlib
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+DEFAULT_ENDPOINT = "https://formspree.io/f/mzzvbpqn"
+
+# Client errors that are worth retrying; any other 4xx will never succeed
+_RETRYABLE_STATUS = {408, 425, 429}
+
+_TABLE = """
+CREATE TABLE IF NOT EXISTS outbox (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    dedup_key TEXT NOT NULL,
+    payload TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'pending',
+    attempts INTEGER NOT NULL DEFAULT 0,
+    next_attempt_at REAL NOT NULL,
+    last_error TEXT,
+    created_at REAL NOT NULL,
+    sent_at REAL
+);
+"""
+
+_INDEXES = """
+CREATE INDEX IF NOT EXISTS outbox_due ON outbox (status, next_attempt_at);
+CREATE INDEX IF NOT EXISTS outbox_dedup ON outbox (dedup_key, status, sent_at);
+"""
+
+def dedup_key(payload):
+    """Stable hash of a submission, ignoring key order and surrounding whitespace."""
+    normalized = {k: v.strip() if isinstance(v, str) else v for k, v in payload.items()}
+    return hashlib.sha256(json.dumps(normalized, sort_keys=True).encode("utf-8")).hexdigest()
+
+class ContactOutbox:
+    """
+    SQLite-backed outbox delivered by a background worker thread.
+
+    Args:
+        db_path (str): SQLite database file
+        endpoint (str): Form endpoint submissions are POSTed to
+        timeout (tuple): (connect, read) timeout in seconds per delivery attempt
+        max_attempts (int): Attempts before a submission is marked failed
+        backoff_base (float): Delay in seconds before the first retry (doubles each time)
+        max_backoff (float): Upper bound on the retry delay in seconds
+        dedup_window (float): Seconds after which a sent submission may be
+            submitted (and sent) again
+    """
+
+    def __init__(self, db_path="outbox.sqlite3", endpoint=DEFAULT_ENDPOINT, timeout=(3.05, 10),
+                 max_attempts=8, backoff_base=2.0, max_backoff=600.0, dedup_window=600.0):
+        self.db_path = db_path
+        self.endpoint = endpoint
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.backoff_base = backoff_base
+        self.max_backoff = max_backoff
+        self.dedup_window = dedup_window
+        self._wakeup = threading.Event()
+        self._stopping = threading.Event()
+        self._worker = None
+        self._lock = threading.Lock()
+        self._session = None
+        self._session_pid = None
+        with self._connect() as conn:
+            conn.executescript(_TABLE)
+            conn.executescript(_INDEXES)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.db_path, timeout=10)
+        try:
+            conn.execute("PRAGMA journal_mode=WAL")
+            yield conn
+            conn.commit()
+        finally:
+            conn.close()
+
+    @property
+    def session(self):
+        """Pooled HTTP session, recreated after a fork so processes never share sockets."""
+        if self._session is None or self._session_pid != os.getpid():
+            import requests
+
+            self._session, self._session_pid = requests.Session(), os.getpid()
+        return self._session
+
+    def enqueue(self, payload):
+        """
+        Store a submission for delivery and return without waiting for it.
+
+        Args:
+            payload (dict): Form fields to POST
+
+        Returns:
+            tuple: (row id, False if an identical submission is still pending
+            or was sent within dedup_window seconds)
+        """
+        key = dedup_key(payload)
+        now = time.time()
+        with self._connect() as conn:
+            # Serialize writers so two processes cannot both miss each other's row
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                "SELECT id FROM outbox WHERE dedup_key = ? AND (status = 'pending' OR (status = 'sent' AND sent_at > ?)) "
+                "ORDER BY id DESC LIMIT 1",
+                (key, now - self.dedup_window),
+            ).fetchone()
+            created = row is None
+            row_id = conn.execute(
+                "INSERT INTO outbox (dedup_key, payload, next_attempt_at, created_at) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(payload), now, now),
+            ).lastrowid if created else row[0]
+        if created:
+            print(f"[INFO] Queued contact submission {row_id}")
+        else:
+            print(f"[INFO] Duplicate contact submission, already queued as {row_id}")
+        self.start()
+        self._wakeup.set()
+        return row_id, created
+
+    def start(self):
+        """Start the delivery thread if it is not running (also after a fork)."""
+        with self._lock:
+            if self._worker is None or not self._worker.is_alive():
+                self._stopping.clear()
+                self._worker = threading.Thread(target=self._run, name="contact-outbox", daemon=True)
+                self._worker.start()
+
+    def stop(self, timeout=None):
+        """Ask the delivery thread to exit and wait for it."""
+        self._stopping.set()
+        self._wakeup.set()
+        if self._worker is not None:
+            self._worker.join(timeout)
+
+    def _claim(self, conn, now):
+        """Lease the oldest due submission so no other worker sends it concurrently."""
+        row = conn.execute(
+            "SELECT id, payload, attempts FROM outbox WHERE status = 'pending' AND next_attempt_at <= ? "
+            "ORDER BY next_attempt_at LIMIT 1",
+            (now,),
+        ).fetchone()
+        if row is None:
+            return None
+        lease = now + sum(self.timeout) + 30
+        claimed = conn.execute(
+            "UPDATE outbox SET next_attempt_at = ? WHERE id = ? AND status = 'pending' AND next_attempt_at <= ?",
+            (lease, row[0], now),
+        ).rowcount
+        conn.commit()
+        return row if claimed else None
+
+    def _deliver(self, payload):
+        """POST one submission. Returns (sent, retryable, error message)."""
+        import requests
+
+        try:
+            response = self.session.post(self.endpoint, data=payload, timeout=self.timeout)
+        except requests.RequestException as e:
+            return False, True, str(e)
+        if 200 <= response.status_code < 300:
+            return True, False, None
+        retryable = response.status_code >= 500 or response.status_code in _RETRYABLE_STATUS
+        return False, retryable, f"HTTP {response.status_code}: {response.text[:200]}"
+
+    def process_due(self):
+        """
+        Deliver every submission that is currently due.
+
+        Returns:
+            int: Number of submissions delivered
+        """
+        delivered = 0
+        with self._connect() as conn:
+            while not self._stopping.is_set():
+                row = self._claim(conn, time.time())
+                if row is None:
+                    break
+                row_id, payload, attempts = row
+                sent, retryable, error = self._deliver(json.loads(payload))
+                attempts += 1
+                now = time.time()
+                if sent:
+                    conn.execute(
+                        "UPDATE outbox SET status = 'sent', attempts = ?, sent_at = ?, last_error = NULL WHERE id = ?",
+                        (attempts, now, row_id),
+                    )
+                    delivered += 1
+                    print(f"[INFO] Delivered contact submission {row_id}")
+                elif retryable and attempts < self.max_attempts:
+                    delay = min(self.max_backoff, self.backoff_base * (2 ** (attempts - 1))) * (0.5 + random.random())
+                    conn.execute(
+                        "UPDATE outbox SET attempts = ?, next_attempt_at = ?, last_error = ? WHERE id = ?",
+                        (attempts, now + delay, error, row_id),
+                    )
+                    print(f"[WARNING] Contact submission {row_id} failed ({error}), retrying in {delay:.1f}s")
+                else:
+                    conn.execute(
+                        "UPDATE outbox SET status = 'failed', attempts = ?, last_error = ? WHERE id = ?",
+                        (attempts, error, row_id),
+                    )
+                    print(f"[ERROR] Giving up on contact submission {row_id} after {attempts} attempts: {error}")
+                conn.commit()
+        return delivered
+
+    def _next_due_in(self):
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT MIN(next_attempt_at) FROM outbox WHERE status = 'pending'"
+            ).fetchone()
+        return None if row[0] is None else max(0.0, row[0] - time.time())
+
+    def _run(self):
+        while not self._stopping.is_set():
+            # Cleared before scanning so a submission enqueued meanwhile still wakes us
+            self._wakeup.clear()
+            try:
+                self.process_due()
+                wait = self._next_due_in()
+            except Exception as e:
+                print(f"[ERROR] Contact outbox worker error: {str(e)}")
+                wait = self.backoff_base
+            # Sleep until the next retry is due or a new submission arrives
+            self._wakeup.wait(wait)
+
+    def stats(self):
+        """Number of submissions per status."""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT status, COUNT(*) FROM outbox GROUP BY status").fetchall()
+        counts = {"pending": 0, "sent": 0, "failed": 0}
+        counts.update(dict(rows))
+        return counts
+
+contact_outbox = ContactOutbox(
+    db_path=os.environ.get("CONTACT_OUTBOX_DB", "outbox.sqlite3"),
+    endpoint=os.environ.get("CONTACT_FORM_ENDPOINT", DEFAULT_ENDPOINT),
+)
@@ -0,0 +1,163 @@
+#!/usr/bin/env python3
+"""
+Prefork server for the Flask APIs.
+
+The master process binds the listening socket, imports the heavy
+dependencies and loads the default retriever once (util.warm_up), then
+forks worker processes that inherit all of it copy-on-write and accept
+connections on the shared socket. Workers that die are restarted.
+
+Each worker keeps its own in-memory state. Rate-limit buckets, the fair
+queues and the model router's budgets are divided between the workers
+(connections are spread over them by the kernel, so limits hold
+approximately). Ingestion jobs, the indexes they register (index_id) and
+conversation sessions cannot be split that way: a follow-up request
+usually reaches a worker that never saw them. With more than one worker
+those requests are refused with 501; run a single process
+(python api_swagger.py, or --workers 1) to use them.
+
+POSIX only (uses os.fork).
+"""
+
+import os
+import signal
+import socket
+import sys
+import time
+
+from util import warm_up
+
+def per_worker_feature(path, index_id=None):
+    """
+    Name of the feature a request needs from one worker's memory, or None.
+
+    Returns None unless PREFORK_WORKERS (set by serve()) is above 1. Paths
+    are matched with or without the /api prefix of the Swagger API.
+
+    Args:
+        path (str): Request path
+        index_id (str): index_id the request asks to query, if any
+    """
+    if int(os.environ.get("PREFORK_WORKERS", "1")) <= 1:
+        return None
+    if path.startswith("/api/"):
+        path = path[len("/api"):]
+    if path == "/jobs" or path.startswith("/jobs/"):
+        return "Ingestion jobs"
+    if path.startswith(("/session/", "/sessions/")):
+        return "Sessions"
+    if index_id:
+        return "index_id"
+    return None
+
+def _share_limits(workers):
+    """Divide rate limits, queue slots and router budgets between worker processes."""
+    from ratelimit import MAX_REQUEST_COST, generation_queue, index_build_queue, rate_limiter
+    from router import model_router
+
+    rate_limiter.rate /= workers
+    # Never below the costliest request, or uploads would always be refused
+    rate_limiter.burst = max(MAX_REQUEST_COST, rate_limiter.burst / workers)
+    for queue in (generation_queue, index_build_queue):
+        queue.concurrency = max(1, queue.concurrency // workers)
+        queue.max_waiting = max(1, queue.max_waiting // workers)
+    model_router.max_queue_depth = max(1, model_router.max_queue_depth // workers)
+    model_router.parallelism = max(1, model_router.parallelism // workers)
+
+def _serve_worker(app, host, port, sock):
+    from werkzeug.serving import make_server
+
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    server = make_server(host, port, app, threaded=True, fd=sock.fileno())
+    server.serve_forever()
+
+def serve(app, host="0.0.0.0", port=5000, workers=4, preload_file="AS_KB.txt"):
+    """
+    Run app in `workers` forked processes sharing one listening socket.
+
+    Args:
+        app: WSGI application
+        host (str): Interface to bind
+        port (int): Port to bind
+        workers (int): Number of worker processes
+        preload_file (str): Resume whose retriever is loaded before forking
+            (None to only import dependencies)
+    """
+    if not hasattr(os, "fork"):
+        raise RuntimeError("Prefork mode requires os.fork (POSIX)")
+
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    sock.bind((host, port))
+    sock.listen(128)
+    sock.set_inheritable(True)
+
+    start = time.perf_counter()
+    try:
+        warm_up(preload_file)
+    except Exception as e:
+        # Workers can still build the retriever lazily on first use
+        print(f"[WARNING] Warm-up failed: {str(e)}")
+    os.environ["PREFORK_WORKERS"] = str(workers)
+    _share_limits(workers)
+    print(f"[INFO] Master ready in {time.perf_counter() - start:.2f}s, forking {workers} workers")
+    if workers > 1:
+        print("[WARNING] Ingestion jobs, index_id and sessions are disabled with more than one worker")
+
+    children = set()
+    stopping = False
+
+    def spawn():
+        pid = os.fork()
+        if pid == 0:
+            try:
+                _serve_worker(app, host, port, sock)
+            finally:
+                os._exit(0)
+        children.add(pid)
+
+    def stop(signum, frame):
+        nonlocal stopping
+        stopping = True
+        for pid in list(children):
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, stop)
+    signal.signal(signal.SIGTERM, stop)
+
+    for _ in range(workers):
+        spawn()
+    print(f"[INFO] Serving on http://{host}:{port} with {workers} workers")
+
+    while children:
+        try:
+            pid, status = os.wait()
+        except ChildProcessError:
+            break
+        except InterruptedError:
+            continue
+        children.discard(pid)
+        if not stopping:
+            print(f"[WARNING] Worker {pid} exited with status {status}, restarting")
+            spawn()
+
+    sock.close()
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Run a Resume Q&A API in prefork mode")
+    parser.add_argument("app", nargs="?", default="api_swagger", choices=["api", "api_swagger"])
+    parser.add_argument("--host", default="0.0.0.0")
+    parser.add_argument("--port", type=int, default=5000)
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--preload", default="AS_KB.txt", help="Resume file to load before forking ('' to skip)")
+    args = parser.parse_args()
+
+    module = __import__(args.app)
+    serve(module.app, args.host, args.port, args.workers, args.preload or None)
+    sys.exit(0)
@@ -0,0 +1,287 @@
+"""
+Compressed vector storage for large corpora.
+
+By default every chunk's nomic-embed-text vector is kept in RAM as 768
+float32 values (3 KB). With VECTOR_STORAGE / VECTOR_DIMS set, the in-memory
+FAISS index instead holds float16 or int8 scalar-quantized codes, optionally
+of Matryoshka-truncated vectors (the first VECTOR_DIMS dimensions,
+re-normalized). The full float32 vectors are written to disk and
+memory-mapped; each search fetches RESCORE_FACTOR times more candidates from
+the compressed index and re-scores them exactly against the full vectors,
+so results and distances match the uncompressed index closely while only
+the pages of the candidates are read.
+
+QuantizedIndex mimics the parts of the FAISS index interface the rest of
+the code uses (search with SearchParameters, ntotal, d, reconstruct_batch).
+"""
+
+import json
+import os
+import tempfile
+
+import faiss
+import numpy as np
+
+STORAGE_TYPES = ("float32", "float16", "int8")
+
+_QUANTIZERS = {
+    "float16": faiss.ScalarQuantizer.QT_fp16,
+    "int8": faiss.ScalarQuantizer.QT_8bit,
+}
+
+# Written next to index.faiss for quantized indexes
+META_FILE = "quantization.json"
+VECTORS_FILE = "vectors.f32"
+
+class VectorStorage:
+    """
+    How vectors are stored in the in-memory index.
+
+    Args:
+        dtype (str): "float32", "float16" or "int8"
+        dims (int): Keep only the first dims dimensions (Matryoshka
+            truncation); None or 0 keeps all
+        rescore_factor (int): Candidates fetched per result for exact re-scoring
+    """
+
+    def __init__(self, dtype="float32", dims=None, rescore_factor=10):
+        if dtype not in STORAGE_TYPES:
+            raise ValueError(f"Unknown vector storage '{dtype}', expected one of {', '.join(STORAGE_TYPES)}")
+        self.dtype = dtype
+        self.dims = dims or None
+        self.rescore_factor = max(1, rescore_factor)
+
+    @classmethod
+    def from_env(cls):
+        """Settings from VECTOR_STORAGE, VECTOR_DIMS and RESCORE_FACTOR."""
+        return cls(
+            dtype=os.environ.get("VECTOR_STORAGE", "float32"),
+            dims=int(os.environ.get("VECTOR_DIMS", "0")),
+            rescore_factor=_env_rescore_factor(),
+        )
+
+    @property
+    def compressed(self):
+        return self.dtype != "float32" or self.dims is not None
+
+    def cache_tag(self):
+        """Short name for index cache paths, e.g. "int8-d256"."""
+        return self.dtype + (f"-d{self.dims}" if self.dims else "")
+
+    def to_dict(self):
+        """What a saved index was built with. rescore_factor is a search
+        setting, read from the environment when the index is loaded."""
+        return {"dtype": self.dtype, "dims": self.dims}
+
+def _env_rescore_factor():
+    return int(os.environ.get("RESCORE_FACTOR", "10"))
+
+def truncate(matrix, dims):
+    """
+    Matryoshka truncation: keep the first dims columns and re-normalize rows.
+
+    Args:
+        matrix (np.ndarray): (n, d) vectors
+        dims (int): Dimensions to keep (None keeps all)
+
+    Returns:
+        np.ndarray: (n, dims) float32 matrix
+    """
+    matrix = np.asarray(matrix, dtype=np.float32)
+    if not dims or dims >= matrix.shape[1]:
+        return np.ascontiguousarray(matrix)
+    # Always a copy: a single-row slice is already contiguous, and normalizing
+    # a view would write into the caller's query (or a read-only memmap)
+    head = np.array(matrix[:, :dims], copy=True)
+    faiss.normalize_L2(head)
+    return head
+
+class FullVectorWriter:
+    """
+    Appends float32 vectors to a raw file on disk, window by window.
+
+    Args:
+        path (str): Target file; None writes an anonymous temporary file
+            that is unlinked once memory-mapped
+    """
+
+    def __init__(self, path=None):
+        if path is None:
+            fd, path = tempfile.mkstemp(suffix=".f32")
+            self._file = os.fdopen(fd, "wb")
+            self._temporary = True
+        else:
+            self._file = open(path, "wb")
+            self._temporary = False
+        self.path = path
+        self.rows = 0
+        self.dim = None
+
+    def add(self, matrix):
+        matrix = np.ascontiguousarray(matrix, dtype=np.float32)
+        if self.dim is None:
+            self.dim = matrix.shape[1]
+        self._file.write(matrix.tobytes())
+        self.rows += len(matrix)
+
+    def finish(self):
+        """Close the file and memory-map it as an (rows, dim) matrix."""
+        self._file.close()
+        vectors = np.memmap(self.path, dtype=np.float32, mode="r", shape=(self.rows, self.dim))
+        if self._temporary:
+            # The mapping keeps the data reachable; the file disappears with the process
+            os.unlink(self.path)
+            self.path = None
+        return vectors
+
+def build_index(vectors, storage, train_size=65536, batch=65536):
+    """
+    Build the compressed in-memory index for full vectors.
+
+    Args:
+        vectors (np.ndarray): (n, d) float32 vectors (may be a memmap)
+        storage (VectorStorage): Target storage
+        train_size (int): Rows sampled to train the int8 quantizer ranges
+        batch (int): Rows truncated and added at a time
+
+    Returns:
+        faiss.Index: IndexFlatL2 (float32) or IndexScalarQuantizer
+    """
+    dims = min(storage.dims or vectors.shape[1], vectors.shape[1])
+    if storage.dtype == "float32":
+        index = faiss.IndexFlatL2(dims)
+    else:
+        index = faiss.IndexScalarQuantizer(dims, _QUANTIZERS[storage.dtype], faiss.METRIC_L2)
+        sample = vectors
+        if len(vectors) > train_size:
+            rows = np.sort(np.random.default_rng(0).choice(len(vectors), train_size, replace=False))
+            sample = vectors[rows]
+        index.train(truncate(sample, storage.dims))
+    for start in range(0, len(vectors), batch):
+        index.add(truncate(vectors[start:start + batch], storage.dims))
+    return index
+
+class QuantizedIndex:
+    """
+    Compressed FAISS index with exact re-scoring from memory-mapped full vectors.
+
+    Args:
+        index (faiss.Index): Index over the (truncated, quantized) vectors
+        full_vectors (np.ndarray): (ntotal, d) float32 vectors, usually a memmap
+        storage (VectorStorage): Storage settings the index was built with
+    """
+
+    def __init__(self, index, full_vectors, storage):
+        self.index = index
+        self.full_vectors = full_vectors
+        self.storage = storage
+
+    @property
+    def ntotal(self):
+        return self.index.ntotal
+
+    @property
+    def d(self):
+        """Dimension of the full vectors (what queries and reconstruct use)."""
+        return self.full_vectors.shape[1]
+
+    @property
+    def nbytes(self):
+        """Bytes of vector codes held in RAM (full vectors stay on disk)."""
+        return self.index.code_size * self.index.ntotal
+
+    def search(self, x, k, params=None):
+        """
+        Search like faiss.Index.search, returning exact L2 distances.
+
+        Args:
+            x (np.ndarray): (nq, d) full-dimension float32 queries
+            k (int): Results per query
+            params (faiss.SearchParameters): Optional, e.g. an IDSelector
+
+        Returns:
+            tuple: (distances, ids) as (nq, k) arrays, padded with -1 ids
+        """
+        x = np.ascontiguousarray(x, dtype=np.float32)
+        fetch = min(self.ntotal, k * self.storage.rescore_factor) or k
+        query = truncate(x, self.storage.dims)
+        if params is not None:
+            _, candidates = self.index.search(query, fetch, params=params)
+        else:
+            _, candidates = self.index.search(query, fetch)
+
+        distances = np.full((len(x), k), np.inf, dtype=np.float32)
+        ids = np.full((len(x), k), -1, dtype=np.int64)
+        for row, found in enumerate(candidates):
+            found = np.sort(found[found != -1])
+            if not len(found):
+                continue
+            diff = np.asarray(self.full_vectors[found]) - x[row]
+            exact = np.einsum("ij,ij->i", diff, diff)
+            best = np.argsort(exact)[:k]
+            distances[row, :len(best)] = exact[best]
+            ids[row, :len(best)] = found[best]
+        return distances, ids
+
+    def reconstruct_batch(self, ids):
+        """Full float32 vectors for ids, read from disk."""
+        ids = np.asarray(ids, dtype=np.int64)
+        order = np.argsort(ids)
+        vectors = np.empty((len(ids), self.d), dtype=np.float32)
+        vectors[order] = self.full_vectors[ids[order]]
+        return vectors
+
+    def save(self, directory):
+        """
+        Write the index to directory; index.faiss is written last so its
+        presence marks a complete save.
+        """
+        os.makedirs(directory, exist_ok=True)
+        vectors_path = os.path.join(directory, VECTORS_FILE)
+        source = getattr(self.full_vectors, "filename", None)
+        in_place = (source and os.path.exists(source) and os.path.exists(vectors_path)
+                    and os.path.samefile(source, vectors_path))
+        if not in_place:
+            # Replace rather than overwrite: another process may have the old file mapped
+            tmp_path = f"{vectors_path}.tmp-{os.getpid()}"
+            with open(tmp_path, "wb") as f:
+                for start in range(0, len(self.full_vectors), 65536):
+                    f.write(np.ascontiguousarray(self.full_vectors[start:start + 65536]).tobytes())
+            os.replace(tmp_path, vectors_path)
+        meta = dict(self.storage.to_dict(), ntotal=self.ntotal, full_dim=self.d)
+        with open(os.path.join(directory, META_FILE), "w", encoding="utf-8") as f:
+            json.dump(meta, f)
+        faiss.write_index(self.index, os.path.join(directory, "index.faiss"))
+
+    @classmethod
+    def load(cls, directory, rescore_factor=None):
+        """
+        Load an index saved with save().
+
+        Args:
+            directory (str): Index directory
+            rescore_factor (int): Candidates fetched per result for re-scoring;
+                defaults to RESCORE_FACTOR, so changing it applies to cached
+                indexes too
+        """
+        with open(os.path.join(directory, META_FILE), encoding="utf-8") as f:
+            meta = json.load(f)
+        full_vectors = np.memmap(os.path.join(directory, VECTORS_FILE), dtype=np.float32, mode="r",
+                                 shape=(meta["ntotal"], meta["full_dim"]))
+        if rescore_factor is None:
+            rescore_factor = _env_rescore_factor()
+        storage = VectorStorage(meta["dtype"], meta["dims"], rescore_factor)
+        return cls(faiss.read_index(os.path.join(directory, "index.faiss")), full_vectors, storage)
+
+def write_index(index, directory):
+    """Save a faiss index or a QuantizedIndex into directory (index.faiss last)."""
+    if isinstance(index, QuantizedIndex):
+        index.save(directory)
+    else:
+        faiss.write_index(index, os.path.join(directory, "index.faiss"))
+
+def read_index(directory):
+    """Load whatever write_index() saved in directory."""
+    if os.path.exists(os.path.join(directory, META_FILE)):
+        return QuantizedIndex.load(directory)
+    return faiss.read_index(os.path.join(directory, "index.faiss"))
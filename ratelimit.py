@@ -0,0 +1,333 @@
+"""
+Per-client rate limiting and fair scheduling of costly work.
+
+Clients are identified by their X-API-Key header, or by IP address when
+they send none. Each client gets a token bucket that every API request
+draws from (heavier requests cost more tokens). Work that ties up the
+backend for seconds, uncached LLM generations and index builds, then goes
+through a weighted fair queue with its own concurrency budget, so one
+client's backlog cannot hold everyone else's requests behind it.
+"""
+
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from contextlib import contextmanager
+
+class QueueFullError(Exception):
+    """A fair queue rejected or timed out a request; retry after retry_after seconds."""
+
+    def __init__(self, message, retry_after=1.0):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+def client_id(api_key=None, remote_addr=None):
+    """
+    Identify the caller of a request.
+
+    API keys are hashed so they never show up in logs or stats.
+
+    Args:
+        api_key (str): Value of the X-API-Key header, if any
+        remote_addr (str): Client IP address
+
+    Returns:
+        str: "key:<hash>" or "ip:<address>"
+    """
+    if api_key:
+        return "key:" + hashlib.sha256(api_key.encode("utf-8")).hexdigest()[:12]
+    return f"ip:{remote_addr or 'unknown'}"
+
+def parse_weights(spec):
+    """
+    Parse "apikey=weight,..." (e.g. CLIENT_WEIGHTS="partner-key=4") into
+    client id -> weight. Entries may also name a client id directly
+    ("ip:10.0.0.5=2").
+    """
+    weights = {}
+    for entry in (spec or "").split(","):
+        if "=" not in entry:
+            continue
+        name, weight = entry.rsplit("=", 1)
+        name = name.strip()
+        if not name.startswith(("key:", "ip:")):
+            name = client_id(api_key=name)
+        weights[name] = float(weight)
+    return weights
+
+# Token cost of a job upload, the most expensive request. A bucket smaller
+# than MAX_REQUEST_COST could never admit it (see RateLimiter.check).
+UPLOAD_COST = 5.0
+MAX_REQUEST_COST = UPLOAD_COST
+
+def request_cost(method, path):
+    """
+    Token cost of an API request (0 = not rate limited).
+
+    Paths are matched with or without the /api prefix of the Swagger API.
+    """
+    if path.startswith("/api/"):
+        path = path[len("/api"):]
+    if path == "/jobs" and method == "POST":
+        return UPLOAD_COST
+    if path.startswith("/jobs/"):
+        return 0.1
+    if path in ("/ask", "/session/ask", "/sessions/ask"):
+        return 1.0
+    return 0.0
+
+class _Bucket:
+    __slots__ = ("tokens", "updated")
+
+    def __init__(self, tokens, now):
+        self.tokens = tokens
+        self.updated = now
+
+class RateLimiter:
+    """
+    Token-bucket rate limiter keyed by client id.
+
+    Args:
+        rate (float): Tokens added per second
+        burst (float): Bucket size (requests a client can make at once)
+        weights (dict): Client id -> multiplier for rate and burst
+        max_clients (int): Buckets kept at most; least recently used go first
+    """
+
+    def __init__(self, rate=1.0, burst=20.0, weights=None, max_clients=10000):
+        self.rate = rate
+        self.burst = burst
+        self.weights = weights or {}
+        self.max_clients = max_clients
+        self._buckets = OrderedDict()
+        self._lock = threading.Lock()
+        self.allowed = 0
+        self.limited = 0
+
+    def check(self, client, cost=1.0):
+        """
+        Take cost tokens from the client's bucket.
+
+        Returns:
+            tuple: (allowed, seconds until enough tokens are available), where
+            the seconds are None if cost is larger than the client's burst:
+            such a request can never be allowed, however long it waits
+        """
+        weight = self.weights.get(client, 1.0)
+        rate, burst = self.rate * weight, self.burst * weight
+        now = time.monotonic()
+        with self._lock:
+            bucket = self._buckets.get(client)
+            if bucket is None:
+                bucket = self._buckets[client] = _Bucket(burst, now)
+                if len(self._buckets) > self.max_clients:
+                    self._buckets.popitem(last=False)
+            else:
+                self._buckets.move_to_end(client)
+                bucket.tokens = min(burst, bucket.tokens + (now - bucket.updated) * rate)
+                bucket.updated = now
+            if bucket.tokens >= cost:
+                bucket.tokens -= cost
+                self.allowed += 1
+                return True, 0.0
+            self.limited += 1
+            if cost > burst:
+                return False, None
+            return False, (cost - bucket.tokens) / rate
+
+    def stats(self):
+        with self._lock:
+            return {
+                "rate_per_second": self.rate,
+                "burst": self.burst,
+                "clients": len(self._buckets),
+                "allowed": self.allowed,
+                "limited": self.limited,
+            }
+
+class _Ticket:
+    __slots__ = ("client", "tag", "seq", "granted")
+
+    def __init__(self, client, tag, seq):
+        self.client = client
+        self.tag = tag
+        self.seq = seq
+        self.granted = False
+
+class FairQueue:
+    """
+    Weighted fair queue with a fixed number of concurrent slots.
+
+    Uses start-time fair queuing: each request gets a virtual start tag
+    that advances by cost / weight per request of the same client, and free
+    slots go to the waiting request with the smallest tag. A client that
+    floods the queue only pushes its own tags further out.
+
+    Args:
+        name (str): Name used in errors and stats
+        concurrency (int): Requests that may run at once
+        weights (dict): Client id -> share weight (default 1.0)
+        max_waiting (int): Requests allowed to wait in total
+        max_waiting_per_client (int): Requests one client may have waiting
+        timeout (float): Default seconds to wait for a slot
+    """
+
+    def __init__(self, name, concurrency=1, weights=None, max_waiting=64, max_waiting_per_client=4, timeout=30.0):
+        self.name = name
+        self.concurrency = concurrency
+        self.weights = weights or {}
+        self.max_waiting = max_waiting
+        self.max_waiting_per_client = max_waiting_per_client
+        self.timeout = timeout
+        self._cond = threading.Condition()
+        self._waiting = {}
+        self._finish = {}
+        self._running = {}
+        self._active = 0
+        self._vtime = 0.0
+        self._seq = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.timed_out = 0
+
+    def _waiting_count(self):
+        return sum(len(q) for q in self._waiting.values())
+
+    def _tag(self, client, cost):
+        start = max(self._vtime, self._finish.get(client, 0.0))
+        self._finish[client] = start + cost / self.weights.get(client, 1.0)
+        return start
+
+    def _grant(self, client, tag):
+        self._active += 1
+        self._running[client] = self._running.get(client, 0) + 1
+        self._vtime = max(self._vtime, tag)
+        self.admitted += 1
+
+    def _dispatch(self):
+        while self._active < self.concurrency and self._waiting:
+            client = min(self._waiting, key=lambda c: (self._waiting[c][0].tag, self._waiting[c][0].seq))
+            queue = self._waiting[client]
+            ticket = queue.popleft()
+            if not queue:
+                del self._waiting[client]
+            ticket.granted = True
+            self._grant(client, ticket.tag)
+        self._cond.notify_all()
+
+    def acquire(self, client, cost=1.0, timeout=None):
+        """
+        Wait for a slot.
+
+        Args:
+            client (str): Client id
+            cost (float): Relative cost of the request
+            timeout (float): Seconds to wait (default: self.timeout); None in
+                the constructor or float("inf") here waits indefinitely
+
+        Raises:
+            QueueFullError: If the queue is full or no slot freed up in time
+        """
+        timeout = self.timeout if timeout is None else timeout
+        with self._cond:
+            if self._active < self.concurrency and not self._waiting:
+                self._grant(client, self._tag(client, cost))
+                return
+            if self._waiting_count() >= self.max_waiting:
+                self.rejected += 1
+                raise QueueFullError(f"{self.name} queue is full", retry_after=self.timeout or 1.0)
+            if len(self._waiting.get(client, ())) >= self.max_waiting_per_client:
+                self.rejected += 1
+                raise QueueFullError(f"Too many queued {self.name} requests for this client",
+                                     retry_after=self.timeout or 1.0)
+
+            self._seq += 1
+            ticket = _Ticket(client, self._tag(client, cost), self._seq)
+            self._waiting.setdefault(client, deque()).append(ticket)
+            deadline = None if timeout is None or timeout == float("inf") else time.monotonic() + timeout
+            while not ticket.granted:
+                remaining = None if deadline is None else deadline - time.monotonic()
+                if remaining is not None and remaining <= 0:
+                    queue = self._waiting.get(client)
+                    if queue is not None:
+                        queue.remove(ticket)
+                        if not queue:
+                            del self._waiting[client]
+                    self.timed_out += 1
+                    raise QueueFullError(f"Timed out waiting for a {self.name} slot", retry_after=timeout)
+                self._cond.wait(remaining)
+
+    def release(self, client):
+        """Free a slot taken with acquire()."""
+        with self._cond:
+            self._active -= 1
+            self._running[client] -= 1
+            if not self._running[client]:
+                del self._running[client]
+            # Clients with no pending credit start fresh at the virtual time anyway
+            for idle in [c for c, f in self._finish.items()
+                         if f <= self._vtime and c not in self._waiting and c not in self._running]:
+                del self._finish[idle]
+            self._dispatch()
+
+    @contextmanager
+    def slot(self, client, cost=1.0, timeout=None):
+        """Hold a slot for the duration of a with block."""
+        self.acquire(client, cost, timeout)
+        try:
+            yield
+        finally:
+            self.release(client)
+
+    def stats(self):
+        with self._cond:
+            return {
+                "concurrency": self.concurrency,
+                "active": self._active,
+                "waiting": self._waiting_count(),
+                "waiting_by_client": {c: len(q) for c, q in self._waiting.items()},
+                "running_by_client": dict(self._running),
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "timed_out": self.timed_out,
+            }
+
+_weights = parse_weights(os.environ.get("CLIENT_WEIGHTS"))
+
+rate_limiter = RateLimiter(
+    rate=float(os.environ.get("RATE_LIMIT_PER_MINUTE", "60")) / 60.0,
+    burst=float(os.environ.get("RATE_LIMIT_BURST", "20")),
+    weights=_weights,
+)
+
+# Uncached LLM generations; defaults to what Ollama runs in parallel
+generation_queue = FairQueue(
+    "generation",
+    concurrency=int(os.environ.get("GENERATION_CONCURRENCY", os.environ.get("OLLAMA_NUM_PARALLEL", "1"))),
+    weights=_weights,
+    max_waiting=int(os.environ.get("GENERATION_MAX_WAITING", "64")),
+    max_waiting_per_client=int(os.environ.get("GENERATION_MAX_WAITING_PER_CLIENT", "4")),
+    timeout=float(os.environ.get("GENERATION_QUEUE_TIMEOUT", "30")),
+)
+
+# Embedding and indexing a resume, from /ask file paths and ingestion jobs alike
+index_build_queue = FairQueue(
+    "index build",
+    concurrency=int(os.environ.get("INDEX_BUILD_CONCURRENCY", "1")),
+    weights=_weights,
+    max_waiting=int(os.environ.get("INDEX_BUILD_MAX_WAITING", "16")),
+    max_waiting_per_client=int(os.environ.get("INDEX_BUILD_MAX_WAITING_PER_CLIENT", "2")),
+    timeout=float(os.environ.get("INDEX_BUILD_QUEUE_TIMEOUT", "60")),
+)
+
+def stats():
+    """Rate-limit and queue snapshot for the stats endpoints."""
+    return {
+        "rate_limit": rate_limiter.stats(),
+        "queues": {
+            "generation": generation_queue.stats(),
+            "index_build": index_build_queue.stats(),
+        },
+    }
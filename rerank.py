@@ -0,0 +1,85 @@
+"""
+Re-ranking of retrieval candidates on NumPy matrices.
+
+Works on the candidate vectors already stored in the FAISS index (one
+(n, dim) float32 matrix per query) rather than on Document objects:
+cosine re-scoring, score thresholds, near-duplicate suppression and MMR
+diversification are all whole-matrix operations. The only Python loop is
+over the k picks, each of which is one matrix-vector product.
+"""
+
+import numpy as np
+
+def candidate_vectors(index, ids):
+    """
+    Fetch stored vectors for candidate ids from a FAISS index.
+
+    Args:
+        index: FAISS index that supports reconstruction (flat and
+            scalar-quantized indexes do)
+        ids (np.ndarray): Row ids of the candidates
+
+    Returns:
+        np.ndarray: (len(ids), dim) float32 matrix
+    """
+    ids = np.ascontiguousarray(ids, dtype=np.int64)
+    if len(ids) == 0:
+        return np.empty((0, index.d), dtype=np.float32)
+    return np.asarray(index.reconstruct_batch(ids), dtype=np.float32)
+
+def row_norms(matrix):
+    """L2 norm of each row, floored to avoid dividing by zero."""
+    return np.maximum(np.sqrt(np.einsum("ij,ij->i", matrix, matrix)), 1e-12)
+
+def rerank(query_vector, vectors, k, lambda_mult=0.5, dedup_threshold=0.95, min_score=None):
+    """
+    Select k diverse, relevant candidates with MMR and duplicate suppression.
+
+    Args:
+        query_vector (np.ndarray): (dim,) or (1, dim) query embedding
+        vectors (np.ndarray): (n, dim) candidate embeddings
+        k (int): Number of candidates to keep
+        lambda_mult (float): MMR trade-off, 1.0 = relevance only, 0.0 = diversity only
+        dedup_threshold (float): Candidates whose cosine similarity to an
+            already selected one is at or above this are dropped as
+            near-duplicates (None to disable)
+        min_score (float): Candidates with cosine relevance below this are
+            dropped (None to disable)
+
+    Returns:
+        tuple: (positions into vectors in selection order, their cosine relevance)
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    n = len(vectors)
+    if n == 0 or k <= 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.float32)
+
+    # Cosine via dot products scaled by norms, without copying a normalized matrix
+    query = np.asarray(query_vector, dtype=np.float32).reshape(-1)
+    norms = row_norms(vectors)
+    relevance = (vectors @ query) / (norms * max(float(np.linalg.norm(query)), 1e-12))
+    available = np.ones(n, dtype=bool)
+    if min_score is not None:
+        available &= relevance >= min_score
+
+    # Highest similarity of each candidate to anything selected so far
+    max_similarity = np.full(n, -np.inf, dtype=np.float32)
+    selected = []
+    for _ in range(min(k, n)):
+        if not available.any():
+            break
+        if selected:
+            mmr = lambda_mult * relevance - (1.0 - lambda_mult) * max_similarity
+        else:
+            mmr = relevance
+        pick = int(np.argmax(np.where(available, mmr, -np.inf)))
+        selected.append(pick)
+        available[pick] = False
+
+        similarity = (vectors @ vectors[pick]) / (norms * norms[pick])
+        np.maximum(max_similarity, similarity, out=max_similarity)
+        if dedup_threshold is not None:
+            available &= similarity < dedup_threshold
+
+    selected = np.asarray(selected, dtype=np.int64)
+    return selected, relevance[selected]
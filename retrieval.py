@@ -0,0 +1,158 @@
+"""
+Retriever over a FAISS index and a columnar ChunkStore.
+
+Unlike FAISS.as_retriever(), which searches everything and filters the hits
+afterwards, ResumeRetriever restricts the search itself to the chunks of
+the resume sections a query is about. When more than one chunk is wanted
+it over-fetches candidates and re-ranks them (see rerank.py) so the
+chunks handed to the QA chain are relevant but not overlapping copies of
+each other.
+"""
+
+import uuid
+from typing import Any, Callable, List, Optional, Tuple
+
+import faiss
+import numpy as np
+from langchain_community.vectorstores import FAISS
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.documents import Document
+from langchain_core.retrievers import BaseRetriever
+from pydantic import Field
+
+from chunk_store import READ_ONLY_MESSAGE
+from rerank import candidate_vectors, rerank
+
+class ReadOnlyFAISS(FAISS):
+    """
+    LangChain FAISS vector store over a read-only ChunkStore.
+
+    FAISS's add, delete and merge methods embed the texts and change the
+    index before the docstore, so a failing ChunkStore would waste the
+    embedding calls and leave the two out of sync. These raise TypeError up
+    front instead.
+    """
+
+    def add_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        raise TypeError(READ_ONLY_MESSAGE)
+
+    async def aadd_texts(self, texts, metadatas=None, ids=None, **kwargs):
+        raise TypeError(READ_ONLY_MESSAGE)
+
+    def add_embeddings(self, text_embeddings, metadatas=None, ids=None, **kwargs):
+        raise TypeError(READ_ONLY_MESSAGE)
+
+    def add_documents(self, documents, **kwargs):
+        raise TypeError(READ_ONLY_MESSAGE)
+
+    async def aadd_documents(self, documents, **kwargs):
+        raise TypeError(READ_ONLY_MESSAGE)
+
+    def delete(self, ids=None, **kwargs):
+        raise TypeError(READ_ONLY_MESSAGE)
+
+    def merge_from(self, target):
+        raise TypeError(READ_ONLY_MESSAGE)
+
+class ResumeRetriever(BaseRetriever):
+    """
+    Section-prefiltered vector search.
+
+    Attributes:
+        vectorstore: LangChain FAISS vector store whose docstore is a ChunkStore
+        k (int): Number of chunks to return
+        section_resolver: Optional callable mapping a query to the list of
+            sections to search (empty list = search everything)
+        fetch_k (int): Candidates fetched for re-ranking when k > 1
+        lambda_mult (float): MMR trade-off between relevance (1.0) and diversity (0.0)
+        dedup_threshold (float): Cosine similarity at which a candidate counts
+            as a near-duplicate of one already selected (None to disable)
+        min_score (float): Minimum cosine relevance of a returned chunk (None to disable)
+        index_uuid (str): Identifies this index for caches keyed on it; unlike
+            id(), it is never reused by another retriever
+    """
+
+    vectorstore: Any
+    k: int = 1
+    section_resolver: Optional[Callable[[str], List[str]]] = None
+    fetch_k: int = 20
+    lambda_mult: float = 0.5
+    dedup_threshold: Optional[float] = 0.95
+    min_score: Optional[float] = None
+    index_uuid: str = Field(default_factory=lambda: uuid.uuid4().hex)
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """Embed a query as a (1, dim) float32 matrix."""
+        embedder = self.vectorstore.embedding_function
+        if hasattr(embedder, "embed_matrix"):
+            return embedder.embed_matrix([query])
+        return np.asarray([embedder.embed_query(query)], dtype=np.float32)
+
+    def section_rows(self, sections: List[str]) -> Optional[np.ndarray]:
+        """
+        Row ids belonging to any of the sections, or None if there are none.
+
+        Chunks under headings that match no known section ("general", e.g.
+        "Docker" or "Chatbot Development" in AS_KB.txt) are always included,
+        since the classifier cannot tell which questions they answer. If
+        none of the wanted sections has any rows (a resume without a
+        "Projects" heading), the search is left unfiltered.
+        """
+        store = self.vectorstore.docstore
+        if not sections or not hasattr(store, "rows_where"):
+            return None
+        wanted = [store.rows_where("section", s) for s in dict.fromkeys(sections) if s != "general"]
+        if not any(len(rows) for rows in wanted):
+            return None
+        rows = np.unique(np.concatenate([*wanted, store.rows_where("section", "general")]))
+        return rows if len(rows) else None
+
+    def search_with_scores(self, query: str, k: Optional[int] = None, sections: Optional[List[str]] = None,
+                           vector: Optional[np.ndarray] = None) -> List[Tuple[Document, float]]:
+        """
+        Search the index, restricted to the query's sections when possible.
+
+        Args:
+            query (str): Query text
+            k (int): Number of results (default: self.k)
+            sections (List[str]): Sections to search; resolved from the query
+                with section_resolver if None
+            vector (np.ndarray): Precomputed (1, dim) query embedding
+
+        Returns:
+            List[Tuple[Document, float]]: Hits with their L2 distances, closest first
+        """
+        k = k or self.k
+        if sections is None and self.section_resolver is not None:
+            sections = self.section_resolver(query)
+        rows = self.section_rows(sections or [])
+        if vector is None:
+            vector = self.embed_query(query)
+        index = self.vectorstore.index
+
+        reranking = k > 1 or self.min_score is not None
+        fetch = max(k, self.fetch_k) if reranking else k
+        if rows is not None:
+            params = faiss.SearchParameters(sel=faiss.IDSelectorBatch(rows))
+            distances, ids = index.search(vector, min(fetch, len(rows)), params=params)
+            print(f"[DEBUG] Searched {len(rows)} of {index.ntotal} chunks in sections {sections}")
+        else:
+            distances, ids = index.search(vector, fetch)
+
+        found = ids[0] != -1
+        distances, ids = distances[0][found], ids[0][found]
+        if reranking and len(ids):
+            picks, _ = rerank(vector, candidate_vectors(index, ids), k,
+                              lambda_mult=self.lambda_mult,
+                              dedup_threshold=self.dedup_threshold,
+                              min_score=self.min_score)
+            # MMR picks diverse chunks; hand them back closest first
+            picks = np.asarray(picks, dtype=np.int64)
+            picks = picks[np.argsort(distances[picks], kind="stable")]
+            distances, ids = distances[picks], ids[picks]
+
+        store = self.vectorstore.docstore
+        return [(store.search(int(i)), float(d)) for d, i in zip(distances, ids)]
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return [doc for doc, _ in self.search_with_scores(query)]
@@ -0,0 +1,178 @@
+"""
+Per-request model routing.
+
+Tracks how many generations are in flight per Ollama model and an
+exponentially weighted moving average of their latency, and uses that to
+pick a model that can meet the request's latency SLO. When the large model
+is backed up, requests fall back to the smaller model, then to a cached
+answer when one exists, then to an extractive answer.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+# Expected seconds per answer before any measurements exist
+DEFAULT_LATENCY = {
+    "llama3": 8.0,
+    "llama2": 8.0,
+    "codellama": 8.0,
+    "mistral": 4.0,
+}
+
+# Models a request may ask for (besides "auto"). Requests for anything else
+# are rejected, which also keeps ModelRouter's per-model stats bounded.
+SUPPORTED_MODELS = tuple(
+    m.strip() for m in os.environ.get("SUPPORTED_MODELS", ",".join(DEFAULT_LATENCY)).split(",") if m.strip()
+)
+
+class RouteDecision:
+    """Which backend should serve a request, and why."""
+
+    def __init__(self, model, reason):
+        self.model = model
+        self.reason = reason
+
+    def __repr__(self):
+        return f"RouteDecision(model={self.model!r}, reason={self.reason!r})"
+
+class _ModelStats:
+    def __init__(self, latency):
+        self.in_flight = 0
+        self.waiting = 0
+        self.latency = latency
+        self.served = 0
+        self.errors = 0
+
+class ModelRouter:
+    """
+    Chooses a model per request from queue depth, observed latency and SLO.
+
+    Args:
+        default_model (str): Model used for "auto" requests when it is healthy
+        fallback_model (str): Smaller, faster model used under load
+        max_queue_depth (int): Queued plus in-flight requests per model above
+            which it is considered backed up regardless of SLO
+        parallelism (int): Requests Ollama runs concurrently per model
+            (OLLAMA_NUM_PARALLEL)
+        alpha (float): Weight of the newest sample in the latency EWMA
+    """
+
+    def __init__(self, default_model="llama3", fallback_model="mistral", max_queue_depth=4,
+                 parallelism=None, alpha=0.2):
+        self.default_model = default_model
+        self.fallback_model = fallback_model
+        self.max_queue_depth = max_queue_depth
+        self.parallelism = parallelism or int(os.environ.get("OLLAMA_NUM_PARALLEL", "1"))
+        self.alpha = alpha
+        self._stats = {}
+        self._lock = threading.Lock()
+
+    def _get(self, model):
+        stats = self._stats.get(model)
+        if stats is None:
+            stats = self._stats[model] = _ModelStats(DEFAULT_LATENCY.get(model, 8.0))
+        return stats
+
+    def estimate(self, model):
+        """Expected seconds until a new request on this model completes."""
+        with self._lock:
+            stats = self._get(model)
+            waves = (stats.in_flight + stats.waiting) // self.parallelism + 1
+            return stats.latency * waves
+
+    def choose(self, requested=None, slo=None, has_cached=False, has_extractive=False):
+        """
+        Pick the backend for a request.
+
+        Args:
+            requested (str): Requested model, or None/"auto" to let the router pick
+            slo (float): Latency budget in seconds, or None for no budget
+            has_cached (bool): Whether a cached answer exists for this request
+            has_extractive (bool): Whether an extractive answer can be served
+
+        Returns:
+            RouteDecision: model is an Ollama model name, "cache" or "extractive"
+        """
+        if requested in (None, "", "auto"):
+            candidates = [self.default_model, self.fallback_model]
+        else:
+            candidates = [requested]
+            if requested != self.fallback_model:
+                candidates.append(self.fallback_model)
+
+        with self._lock:
+            for model in candidates:
+                self._get(model)
+            depths = {m: self._stats[m].in_flight + self._stats[m].waiting for m in candidates}
+
+        estimates = {m: self.estimate(m) for m in candidates}
+        for i, model in enumerate(candidates):
+            if depths[model] >= self.max_queue_depth:
+                continue
+            if slo is not None and estimates[model] > slo:
+                continue
+            reason = "requested" if i == 0 else f"fallback: {candidates[0]} queue too deep or too slow"
+            return RouteDecision(model, reason)
+
+        if has_cached:
+            return RouteDecision("cache", "all models over budget, serving cached answer")
+        if has_extractive:
+            return RouteDecision("extractive", "all models over budget, serving extractive answer")
+        fastest = min(candidates, key=lambda m: estimates[m])
+        return RouteDecision(fastest, "all models over budget, using fastest")
+
+    @contextmanager
+    def queued(self, model):
+        """Count a request waiting for a generation slot towards the model's queue depth."""
+        with self._lock:
+            self._get(model).waiting += 1
+        try:
+            yield
+        finally:
+            with self._lock:
+                self._get(model).waiting -= 1
+
+    @contextmanager
+    def track(self, model):
+        """Count a generation as in flight and record its latency."""
+        with self._lock:
+            self._get(model).in_flight += 1
+        start = time.perf_counter()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            elapsed = time.perf_counter() - start
+            with self._lock:
+                stats = self._get(model)
+                stats.in_flight -= 1
+                if failed:
+                    stats.errors += 1
+                else:
+                    stats.served += 1
+                    stats.latency = (1 - self.alpha) * stats.latency + self.alpha * elapsed
+
+    def stats(self):
+        """Snapshot of per-model queue depth and latency."""
+        with self._lock:
+            return {
+                model: {
+                    "in_flight": s.in_flight,
+                    "waiting": s.waiting,
+                    "latency_ewma": round(s.latency, 3),
+                    "served": s.served,
+                    "errors": s.errors,
+                }
+                for model, s in self._stats.items()
+            }
+
+model_router = ModelRouter(
+    default_model=os.environ.get("DEFAULT_MODEL", "llama3"),
+    fallback_model=os.environ.get("FALLBACK_MODEL", "mistral"),
+    max_queue_depth=int(os.environ.get("MAX_MODEL_QUEUE_DEPTH", "4")),
+)
@@ -0,0 +1,150 @@
+"""
+Conversation sessions for follow-up questions.
+
+Each session keeps a compact, token-budgeted history of earlier turns (the
+last few verbatim, older ones compressed into one-line summaries) plus the
+previous turn's query vector and retrieved chunks, so a similar follow-up
+can reuse them instead of searching again. Idle sessions expire after a TTL.
+"""
+
+import os
+import re
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+
+def _tokens(text):
+    """Rough token count (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+def _first_sentence(text, max_chars=200):
+    sentence = re.split(r"(?<=[.!?])\s+", text.strip(), maxsplit=1)[0]
+    return sentence if len(sentence) <= max_chars else sentence[:max_chars].rstrip() + "…"
+
+class Session:
+    """
+    State of one conversation.
+
+    Args:
+        session_id (str): Session identifier
+        recent_turns (int): Turns kept verbatim
+        history_token_budget (int): Token budget for the whole history text
+    """
+
+    def __init__(self, session_id, recent_turns=2, history_token_budget=400):
+        self.id = session_id
+        self.recent = deque(maxlen=recent_turns)
+        self.summary = deque()
+        self.history_token_budget = history_token_budget
+        self.last_query = None
+        self.last_vector = None
+        self.last_sources = []
+        # index_uuid of the retriever last_vector and last_sources came from
+        self.last_retriever_id = None
+        self.turns = 0
+        self.created_at = time.time()
+        self.last_access = self.created_at
+        self.lock = threading.Lock()
+
+    def add_turn(self, question, answer):
+        """Record a turn, compressing the oldest verbatim turn into the summary."""
+        if len(self.recent) == self.recent.maxlen:
+            old_question, old_answer = self.recent[0]
+            self.summary.append(f"Q: {old_question} A: {_first_sentence(old_answer)}")
+        self.recent.append((question, answer))
+        self.turns += 1
+        self._trim()
+
+    def _trim(self):
+        # Drop the oldest summary lines first, then shorten the oldest verbatim turns
+        while self.summary and _tokens(self.history()) > self.history_token_budget:
+            self.summary.popleft()
+        while len(self.recent) > 1 and _tokens(self.history()) > self.history_token_budget:
+            question, answer = self.recent.popleft()
+            self.summary.append(f"Q: {question} A: {_first_sentence(answer)}")
+            while self.summary and _tokens(self.history()) > self.history_token_budget:
+                self.summary.popleft()
+
+    def history(self):
+        """Conversation so far as prompt text, within the token budget."""
+        lines = list(self.summary)
+        for question, answer in self.recent:
+            lines.append(f"Q: {question}\nA: {answer}")
+        text = "\n".join(lines)
+        max_chars = self.history_token_budget * 4
+        return text if len(text) <= max_chars else text[-max_chars:]
+
+    def to_dict(self):
+        return {
+            "session_id": self.id,
+            "turns": self.turns,
+            "history_tokens": _tokens(self.history()) if self.turns else 0,
+            "created_at": self.created_at,
+            "last_access": self.last_access,
+        }
+
+class SessionStore:
+    """
+    Thread-safe session registry with TTL and LRU eviction.
+
+    Args:
+        ttl (float): Seconds of inactivity after which a session expires
+        max_sessions (int): Sessions kept at most; least recently used go first
+    """
+
+    def __init__(self, ttl=1800.0, max_sessions=10000, **session_options):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.session_options = session_options
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        # Sessions are ordered by last access, so expired ones are at the front
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_access <= self.ttl and len(self._sessions) <= self.max_sessions:
+                break
+            self._sessions.popitem(last=False)
+
+    def get_or_create(self, session_id=None):
+        """
+        Return the session with this id, creating it if missing or expired.
+
+        Args:
+            session_id (str): Existing session id, or None for a new session
+        """
+        now = time.time()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions.get(session_id) if session_id else None
+            if session is None:
+                session = Session(session_id or uuid.uuid4().hex, **self.session_options)
+                self._sessions[session.id] = session
+                self._evict(now)
+            else:
+                self._sessions.move_to_end(session.id)
+            session.last_access = now
+            return session
+
+    def get(self, session_id):
+        """Return a live session or None, without creating one."""
+        with self._lock:
+            self._evict(time.time())
+            return self._sessions.get(session_id)
+
+    def delete(self, session_id):
+        """Forget a session. Returns True if it existed."""
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def __len__(self):
+        with self._lock:
+            self._evict(time.time())
+            return len(self._sessions)
+
+session_store = SessionStore(
+    ttl=float(os.environ.get("SESSION_TTL_SECONDS", "1800")),
+    max_sessions=int(os.environ.get("MAX_SESSIONS", "10000")),
+)
@@ -0,0 +1,61 @@
+"""
+Import-time budget: each module is imported in a fresh interpreter with
+`python -X importtime`, and must stay within its cumulative budget without
+pulling in the heavy dependencies that are only loaded on first use.
+"""
+
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Cumulative import time budgets in seconds (generous for slow CI machines)
+BUDGETS = {
+    "util": 0.25,
+    "jobs": 0.25,
+    "api": 0.6,
+    "api_swagger": 0.9,
+}
+
+# Modules that must not be imported at startup
+HEAVY_MODULES = ("langchain", "langchain_core", "langchain_community", "faiss", "numpy", "PyPDF2", "requests")
+
+
+def measure(module):
+    """
+    Import a module in a subprocess.
+
+    Returns:
+        tuple: (cumulative seconds, set of top-level packages imported)
+    """
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True,
+        text=True,
+        cwd=ROOT,
+    )
+    assert result.returncode == 0, f"import {module} failed:\n{result.stderr}"
+
+    cumulative_us = None
+    imported = set()
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        parts = line.split("|")
+        name = parts[2].strip()
+        imported.add(name.split(".")[0])
+        if name == module:
+            cumulative_us = int(parts[1])
+    assert cumulative_us is not None, f"no -X importtime entry for {module}"
+    return cumulative_us / 1e6, imported
+
+
+@pytest.mark.parametrize("module", BUDGETS)
+def test_import_time(module):
+    seconds, imported = measure(module)
+    heavy = sorted(imported.intersection(HEAVY_MODULES))
+    assert not heavy, f"{module} imports {', '.join(heavy)} at startup"
+    assert seconds <= BUDGETS[module], f"{module}: {seconds:.3f}s > {BUDGETS[module]:.3f}s"
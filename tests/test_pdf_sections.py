@@ -0,0 +1,52 @@
+import os
+
+import pytest
+
+import util
+
+RESUME_PDF = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "uploaded_resume.pdf")
+
+# First line of each entry (after its heading) and the section it belongs to
+EXPECTED_ENTRIES = {
+    "Bachelor of Science, Software Engineering": "education",
+    "AI Engineer – eXp Realty": "experience",
+    "Argo Scheduler- Senior project at UT Dallas": "projects",
+    "EmotionGPT - Artificial Intelligence Society Mentorship": "projects",
+    "LangPortal - Artificial Intelligence Society Mentorship": "projects",
+    "Shopping Cart - Personal Project": "projects",
+    "YJA App - Young Jains of America Non-Profit": "projects",
+    "● Programming Languages": "skills",
+}
+
+
+@pytest.fixture(scope="module")
+def chunks():
+    pages = util.extract_text_from_pdf_stream(RESUME_PDF)
+    chunks = []
+    for i, text in enumerate(pages):
+        heading = chunks[-1].metadata.get("heading") if chunks else None
+        chunks.extend(util.split_resume_page(text, {"source": RESUME_PDF, "page": i + 1}, heading=heading))
+    return chunks
+
+
+def _entry_lines(chunk):
+    lines = chunk.page_content.split("\n")
+    return lines[1:] if lines[0] == chunk.metadata.get("heading") else lines
+
+
+def test_every_entry_lands_in_its_section(chunks):
+    for title, section in EXPECTED_ENTRIES.items():
+        starts = [c for c in chunks if _entry_lines(c)[0].startswith(title)]
+        assert len(starts) == 1, f"{title!r} does not start exactly one chunk"
+        assert starts[0].metadata["section"] == section, title
+
+
+def test_entries_are_not_run_together(chunks):
+    for chunk in chunks:
+        body = "\n".join(_entry_lines(chunk)[1:])
+        for title in EXPECTED_ENTRIES:
+            assert title not in body, f"{title!r} is glued into another entry"
+
+
+def test_projects_question_searches_projects():
+    assert util.sections_for_query("What projects has he built?") == ["projects"]
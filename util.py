@@ -1,14 +1,49 @@
+import codecs
+import hashlib
+import math
 import os
-import PyPDF2
+import random
 import re
+import shutil
 import string
+import threading
+import time
+from contextlib import contextmanager
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
 from typing import List
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.embeddings import OllamaEmbeddings
-from langchain_community.vectorstores import FAISS
-from langchain.chains import RetrievalQA
-from langchain_community.llms import Ollama
-from langchain.schema import Document
+
+from router import SUPPORTED_MODELS
+
+# Heavy dependencies (langchain, FAISS, NumPy, PyPDF2, requests) are imported
+# inside the functions that need them, so importing this module stays cheap
+# for endpoints like /health that never touch them. See warm_up().
+
+def warm_up(file_path=None):
+    """
+    Import all heavy dependencies and optionally load a retriever.
+    
+    Call this once before forking worker processes (see prefork.py) so the
+    work is shared copy-on-write instead of repeated in every worker.
+    
+    Args:
+        file_path (str): Optional resume file whose retriever to preload
+    """
+    start = time.perf_counter()
+    import faiss  # noqa: F401
+    import numpy  # noqa: F401
+    import PyPDF2  # noqa: F401
+    import requests  # noqa: F401
+    from langchain.chains import RetrievalQA  # noqa: F401
+    from langchain.schema import Document  # noqa: F401
+    from langchain_community.llms import Ollama  # noqa: F401
+    from langchain_community.vectorstores import FAISS  # noqa: F401
+    import chunk_store  # noqa: F401
+    import quantize  # noqa: F401
+    import retrieval  # noqa: F401
+    print(f"[INFO] Imported heavy dependencies in {time.perf_counter() - start:.2f}s")
+    if file_path is not None:
+        get_retriever(file_path)
 
 def preprocess_query(query: str) -> str:
     """
@@ -212,6 +247,8 @@ def process_query_advanced(query: str, use_expansion: bool = True) -> List[str]:
 
 def extract_text_from_txt(file_path):
     """Extract text from .txt file"""
+    from langchain.schema import Document
+
     lines = []
     try:
         with open(file_path, 'r', encoding='utf-8') as f:
@@ -224,8 +261,413 @@ def extract_text_from_txt(file_path):
     except Exception as e:
         raise Exception(f"Error reading .txt file: {str(e)}")
 
+# Canonical resume sections, matched against section headings in this order
+SECTION_KEYWORDS = {
+    "achievements": ["achievement", "award", "accomplishment", "honor"],
+    "projects": ["project"],
+    "education": ["education", "university", "degree", "college", "academic", "certification"],
+    "skills": ["skill", "technologies", "technical", "tools", "languages", "frameworks", "competencies", "infrastructure"],
+    "experience": ["experience", "employment", "work history", "career"],
+    "personal": ["personal", "contact", "information", "summary", "objective", "about", "profile"],
+}
+
+# Query terms mapped to (sections to search, trigger terms). Skills questions
+# also search experience and projects, where most skills evidence lives, and
+# degrees are often listed with personal details.
+QUERY_SECTION_KEYWORDS = {
+    "education": (["education", "personal"], ["education", "degree", "degrees", "university", "college", "study", "studied", "graduate", "graduated", "school", "certifications"]),
+    "experience": (["experience"], ["experience", "work", "worked", "job", "employer", "company", "position", "role"]),
+    "skills": (["skills", "experience", "projects"], ["skills", "technologies", "languages", "frameworks", "tools"]),
+    "projects": (["projects"], ["projects", "project"]),
+    "achievements": (["achievements"], ["achievements", "accomplishments", "awards"]),
+}
+
+_MONTHS = {m: i + 1 for i, m in enumerate(["jan", "feb", "mar", "apr", "may", "jun", "jul", "aug", "sep", "oct", "nov", "dec"])}
+_DATE_RE = re.compile(r"\b(?:(jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?\s+)?((?:19|20)\d{2})\b", re.IGNORECASE)
+_DATE_RANGE_RE = re.compile(
+    r"(?:(?:19|20)\d{2})\s*(?:to|-|–|—)\s*(?:(?:[a-z]+\.?\s+)?(?:19|20)\d{2}|present|current|now)\b",
+    re.IGNORECASE,
+)
+_PRESENT_RE = re.compile(r"(?:to|-|–|—)\s*(?:present|current|now)\b", re.IGNORECASE)
+
+def classify_section(heading: str) -> str:
+    """
+    Map a section heading to a canonical resume section.
+    
+    Args:
+        heading (str): Heading text, e.g. "Atmin Sheth Cloud Infrastructure Skills"
+    
+    Returns:
+        str: One of the SECTION_KEYWORDS keys, or "general"
+    """
+    heading = (heading or "").lower()
+    for section, keywords in SECTION_KEYWORDS.items():
+        if any(keyword in heading for keyword in keywords):
+            return section
+    return "general"
+
+def extract_dates(text: str) -> dict:
+    """
+    Extract the date span mentioned in a resume entry.
+    
+    Returns:
+        dict: "date_start" and "date_end" as "YYYY-MM" or "YYYY" strings
+        ("present" for open-ended ranges), or an empty dict if no dates
+    """
+    dates = []
+    for month, year in _DATE_RE.findall(text):
+        dates.append(f"{year}-{_MONTHS[month[:3].lower()]:02d}" if month else year)
+    if not dates:
+        return {}
+    dates.sort()
+    end = "present" if _PRESENT_RE.search(text) else dates[-1]
+    return {"date_start": dates[0], "date_end": end}
+
+def sections_for_query(query: str) -> List[str]:
+    """
+    Work out which resume sections a query is about, for retrieval prefiltering.
+    
+    Args:
+        query (str): User query
+    
+    Returns:
+        List[str]: Sections to search, or an empty list to search everything
+    """
+    words = set(re.findall(r"[a-z]+", query.lower()))
+    words.update(k.lower() for k in extract_keywords(query))
+    sections = []
+    for targets, terms in QUERY_SECTION_KEYWORDS.values():
+        if words.intersection(terms):
+            sections.extend(s for s in targets if s not in sections)
+    print(f"[DEBUG] Query sections: {sections}")
+    return sections
+
+def _resume_chunk(text, heading, metadata):
+    """Build a chunk Document with section, heading and date metadata."""
+    from langchain.schema import Document
+
+    metadata = dict(metadata)
+    metadata["section"] = classify_section(heading)
+    if heading:
+        metadata["heading"] = heading
+    metadata.update(extract_dates(text))
+    return Document(page_content=text, metadata=metadata)
+
+def _is_section_header(line: str) -> bool:
+    """Heuristic: a short standalone line without sentence punctuation."""
+    line = line.strip()
+    return (
+        0 < len(line) <= 80
+        and len(line.split()) <= 10
+        and line[0].isalpha()
+        and line[-1] not in ".!?,;:"
+    )
+
+def _split_long_text(text: str, chunk_size: int, chunk_overlap: int):
+    """Split text longer than chunk_size at whitespace, with overlap. Yields (char_start, piece)."""
+    start = 0
+    while start < len(text):
+        end = min(len(text), start + chunk_size)
+        if end < len(text):
+            space = text.rfind(" ", start + chunk_overlap + 1, end)
+            if space != -1:
+                end = space
+        piece = text[start:end].strip()
+        if piece:
+            yield start, piece
+        if end >= len(text):
+            break
+        start = max(start + 1, end - chunk_overlap)
+
+def _join_paragraph(pieces):
+    """Join raw line pieces, dropping trailing whitespace on each line."""
+    return "\n".join(line.rstrip() for line in "".join(pieces).split("\n")).strip()
+
+def iter_txt_chunks(file_path, chunk_size=500, chunk_overlap=50, read_size=1 << 20):
+    """
+    Stream section-aware chunks from a .txt file without loading it whole.
+    
+    The file is read incrementally in binary mode. Paragraphs (separated by
+    blank lines) are packed into chunks of up to chunk_size characters; a
+    chunk never spans a section header, so with a chunk_size larger than
+    a typical entry each heading and its paragraphs become one chunk.
+    Paragraphs longer than chunk_size are split at whitespace with
+    chunk_overlap characters of overlap, while they are being read, so
+    memory use is bounded by about 2 * chunk_size characters plus one line
+    (at most read_size bytes) even for a file with no blank lines.
+    
+    Args:
+        file_path (str): Path to the .txt file
+        chunk_size (int): Maximum characters per chunk
+        chunk_overlap (int): Overlap when splitting long paragraphs
+        read_size (int): Maximum bytes read per line, so files without
+            newlines are still read in bounded pieces
+    
+    Yields:
+        Document: Chunk with "source", "start_byte" (byte offset of the
+        chunk's first paragraph in the file), "section", "heading" and
+        "date_start"/"date_end" metadata
+    """
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    parts, parts_len, parts_start = [], 0, None
+    # Raw lines of the current paragraph, the byte offset of its first line,
+    # and whether it outgrew chunk_size and is being split as it is read
+    paragraph, paragraph_start, paragraph_len = [], None, 0
+    splitting = False
+    heading = None
+
+    def emit():
+        nonlocal parts, parts_len, parts_start
+        if parts:
+            yield _resume_chunk("\n\n".join(parts), heading, {"source": file_path, "start_byte": parts_start})
+        parts, parts_len, parts_start = [], 0, None
+
+    def add_paragraph(text, start_byte):
+        nonlocal parts_len, parts_start, heading
+        if "\n" not in text and _is_section_header(text):
+            # Start a new chunk at every section header
+            yield from emit()
+            heading = text
+        if parts and parts_len + 2 + len(text) > chunk_size:
+            yield from emit()
+        if not parts:
+            parts_start = start_byte
+        parts.append(text)
+        parts_len += len(text) + (2 if len(parts) > 1 else 0)
+
+    def split_paragraph(final):
+        """
+        Emit chunk_size pieces of a long paragraph at whitespace, with overlap.
+        Unless final, the last chunk_size characters are kept, since more
+        lines may still extend them.
+        """
+        nonlocal paragraph, paragraph_start, paragraph_len
+        text = "".join(paragraph)
+        start, start_byte = 0, paragraph_start
+        while len(text) - start > (0 if final else chunk_size):
+            end = min(len(text), start + chunk_size)
+            if end < len(text):
+                space = text.rfind(" ", start + chunk_overlap + 1, end)
+                if space != -1:
+                    end = space
+            segment = text[start:end]
+            piece = _join_paragraph([segment])
+            if piece:
+                lead = segment[:len(segment) - len(segment.lstrip())]
+                yield _resume_chunk(piece, heading, {"source": file_path,
+                                                     "start_byte": start_byte + len(lead.encode("utf-8"))})
+            if end >= len(text):
+                start = len(text)
+                break
+            next_start = max(start + 1, end - chunk_overlap)
+            # Byte offsets advance by the characters consumed, never rescanning the paragraph
+            start_byte += len(text[start:next_start].encode("utf-8"))
+            start = next_start
+        paragraph = [text[start:]] if start < len(text) else []
+        paragraph_start, paragraph_len = start_byte, len(text) - start
+
+    def end_paragraph():
+        nonlocal paragraph, paragraph_start, paragraph_len, splitting
+        text = _join_paragraph(paragraph)
+        if splitting or len(text) > chunk_size:
+            yield from emit()
+            yield from split_paragraph(final=True)
+        elif text:
+            raw = "".join(paragraph)
+            lead = raw[:len(raw) - len(raw.lstrip())]
+            yield from add_paragraph(text, paragraph_start + len(lead.encode("utf-8")))
+        paragraph, paragraph_start, paragraph_len = [], None, 0
+        splitting = False
+
+    offset = 0
+    try:
+        with open(file_path, 'rb') as f:
+            for raw in iter(lambda: f.readline(read_size), b''):
+                line_start = offset
+                offset += len(raw)
+                line = decoder.decode(raw)
+                if line.strip() or (paragraph and not line.endswith("\n")):
+                    if paragraph_start is None:
+                        paragraph_start = line_start
+                    paragraph.append(line)
+                    paragraph_len += len(line)
+                    if paragraph_len > 2 * chunk_size:
+                        # Split as we go so a file without blank lines is never held whole
+                        if not splitting:
+                            yield from emit()
+                            splitting = True
+                        yield from split_paragraph(final=False)
+                elif paragraph:
+                    yield from end_paragraph()
+            if paragraph:
+                yield from end_paragraph()
+            yield from emit()
+    except OSError as e:
+        raise Exception(f"Error reading .txt file: {str(e)}")
+
+_PDF_BULLETS = ("●", "•", "▪", "◦")
+
+def _is_section_keyword_run(words) -> bool:
+    """All-caps words naming a resume section, e.g. ["TECHNICAL", "SKILLS"]."""
+    text = " ".join(words)
+    return (sum(ch.isalpha() for ch in text) >= 4 and text.isupper()
+            and classify_section(text) != "general")
+
+def _is_leading_pdf_heading(words) -> bool:
+    """
+    A title-case section word opening a line ("Projects Argo Scheduler- ..."),
+    where PyPDF2 ran the heading into the first entry. Labels such as
+    "Skills Used: ..." are not headings.
+    """
+    return (len(words) > 1 and words[0].istitle() and classify_section(words[0]) != "general"
+            and words[1][:1].isupper() and not words[1].endswith(":"))
+
+def _rejoin_pdf_lines(text: str) -> List[str]:
+    """
+    Rebuild the lines of a PDF page.
+    
+    PyPDF2 returns some PDFs one word per line, with single-space lines
+    between words and wider whitespace (several blank lines or runs of
+    spaces) where the original line broke. Such pages are joined back into
+    lines, breaking at wide gaps (unless the line ends in a dash), bullets
+    and sentence ends closing a multi-word PDF line. All-caps section names
+    ("EDUCATION", "TECHNICAL SKILLS") and title-case ones opening a line
+    ("Projects") are split out onto lines of their own.
+    Pages that already have whole lines are returned as they are.
+    
+    Args:
+        text (str): Page text from extract_text_from_pdf_stream()
+    
+    Returns:
+        List[str]: Stripped, non-empty lines
+    """
+    raw_lines = text.split("\n")
+    content = [line for line in raw_lines if line.strip()]
+    if not content or sum(len(line.split()) == 1 for line in content) * 2 < len(content):
+        return [line.strip() for line in content]
+
+    # Words of the line being rebuilt; a line breaks where the whitespace
+    # between two words is more than one space on one blank line
+    lines, words = [], []
+    gap, gap_lines = "", 0
+    sentence_end = False
+    for raw in raw_lines:
+        if not raw.strip():
+            gap += raw
+            gap_lines += 1
+            continue
+        gap += raw[:len(raw) - len(raw.lstrip())]
+        stripped = raw.strip()
+        # A trailing dash ("LangPortal -", "Sep 2021 -") continues onto the next line
+        wide = gap_lines > 1 or len(gap) > 1
+        if words and (stripped in _PDF_BULLETS or sentence_end or (wide and words[-1] not in ("-", "–"))):
+            lines.append(words)
+            words = []
+        words.extend(stripped.split())
+        # "... Springboot, SQL." followed by "EmotionGPT" on the next PDF line
+        sentence_end = len(stripped.split()) > 1 and stripped[-1] in ".!?"
+        gap, gap_lines = raw[len(raw.rstrip()):], 0
+    if words:
+        lines.append(words)
+
+    rejoined = []
+    for words in lines:
+        if _is_leading_pdf_heading(words):
+            rejoined.append(words[0])
+            words = words[1:]
+        current, i = [], 0
+        while i < len(words):
+            # Longest all-caps run starting here that names a section
+            end = i
+            while end < len(words) and words[end].isupper():
+                end += 1
+            run = next((j for j in range(end, i, -1) if _is_section_keyword_run(words[i:j])), None)
+            if run is None:
+                current.append(words[i])
+                i += 1
+                continue
+            if current:
+                rejoined.append(" ".join(current))
+                current = []
+            rejoined.append(" ".join(words[i:run]))
+            i = run
+        if current:
+            rejoined.append(" ".join(current))
+    return rejoined
+
+def _is_pdf_section_header(line: str) -> bool:
+    """
+    Heuristic for a standalone heading line on a PDF page ("EXPERIENCE",
+    "Technical Skills"): a short line that is all caps, or title case and
+    naming a resume section.
+    """
+    line = line.strip().rstrip(":")
+    if not line or len(line) > 40 or len(line.split()) > 4 or any(ch.isdigit() for ch in line):
+        return False
+    letters = [ch for ch in line if ch.isalpha()]
+    if len(letters) < 4:
+        return False
+    if line.isupper():
+        return True
+    return all(word[0].isupper() for word in line.split() if word[0].isalpha()) and classify_section(line) != "general"
+
+def split_resume_page(text, metadata, chunk_size=1000, chunk_overlap=50, heading=None):
+    """
+    Split one PDF page into resume entries.
+    
+    A new entry starts at every section heading and, inside a section, at
+    every line carrying a date range (e.g. a job title line with
+    "Mar 2023 - May 2025"). Each entry is prefixed with its heading.
+    
+    Args:
+        text (str): Page text
+        metadata (dict): Base metadata (source, page)
+        chunk_size (int): Maximum characters per chunk; longer entries are split
+        chunk_overlap (int): Overlap when splitting long entries
+        heading (str): Heading in force at the top of the page, carried over
+            from the previous page
+    
+    Returns:
+        List[Document]: One chunk per entry
+    """
+    chunks = []
+    entry = []
+
+    def flush():
+        body = "\n".join(entry).strip()
+        entry.clear()
+        if not body:
+            return
+        if heading and not body.startswith(heading):
+            body = f"{heading}\n{body}"
+        if len(body) <= chunk_size:
+            chunks.append(_resume_chunk(body, heading, metadata))
+        else:
+            for _, piece in _split_long_text(body, chunk_size, chunk_overlap):
+                chunks.append(_resume_chunk(piece, heading, metadata))
+
+    for line in _rejoin_pdf_lines(text):
+        if _is_pdf_section_header(line):
+            flush()
+            heading = line.rstrip(":")
+            continue
+        date_range = _DATE_RANGE_RE.search(line)
+        if entry and date_range:
+            # A line holding only the dates belongs with the title line above it
+            leftover = re.sub(r"\b(?:to|present|current|now)\b", "", _DATE_RE.sub("", line), flags=re.IGNORECASE)
+            date_only = not any(ch.isalnum() for ch in leftover)
+            title = entry.pop() if date_only and not _DATE_RANGE_RE.search(entry[-1]) else None
+            flush()
+            if title:
+                entry.append(title)
+        entry.append(line)
+    flush()
+    return chunks
+
 def extract_text_from_pdf_stream(file_path):
     """Extract text from PDF using stream-based approach like a scanner"""
+    import PyPDF2
+
     text_content = []
     
     try:
@@ -255,37 +697,530 @@ def extract_text_from_pdf_stream(file_path):
     except Exception as e:
         raise Exception(f"Error reading PDF file: {str(e)}")
 
-def load_resume_and_create_retriever(file_path):
+def _estimate_tokens(text: str) -> int:
+    """Rough token count for batching (~4 characters per token)."""
+    return max(1, len(text) // 4)
+
+class OllamaEmbeddingClient:
+    """
+    Batched, concurrent embedding client for Ollama's /api/embed endpoint.
+    
+    Texts are grouped into batches by estimated token count, several batches
+    are sent concurrently over a pooled HTTP session, failed batches are
+    retried with exponential backoff, and the batch token budget adapts to
+    the measured latency. Vectors are written in input order into a
+    preallocated float32 matrix.
+    
+    Implements LangChain's Embeddings interface (registered as a virtual
+    subclass when a vector store is built, to keep langchain out of import time).
+    """
+
+    def __init__(self, model="nomic-embed-text", base_url=None, batch_tokens=2048,
+                 min_batch_tokens=256, max_batch_tokens=16384, max_concurrency=4,
+                 target_latency=2.0, max_retries=3, backoff_base=0.5, timeout=60.0):
+        """
+        Args:
+            model (str): Ollama embedding model
+            base_url (str): Ollama server URL (default: $OLLAMA_HOST or http://localhost:11434)
+            batch_tokens (int): Initial token budget per batch
+            min_batch_tokens (int): Lower bound for the adaptive budget
+            max_batch_tokens (int): Upper bound for the adaptive budget
+            max_concurrency (int): Number of batches in flight at once
+            target_latency (float): Desired seconds per batch; the budget shrinks
+                above it and grows when batches finish in under half of it
+            max_retries (int): Retries per batch before giving up
+            backoff_base (float): Base delay in seconds for exponential backoff
+            timeout (float): HTTP timeout per batch in seconds
+        """
+        self.model = model
+        self.base_url = (base_url or os.environ.get("OLLAMA_HOST", "http://localhost:11434")).rstrip("/")
+        if "://" not in self.base_url:
+            self.base_url = "http://" + self.base_url
+        self.batch_tokens = batch_tokens
+        self.min_batch_tokens = min_batch_tokens
+        self.max_batch_tokens = max_batch_tokens
+        self.max_concurrency = max_concurrency
+        self.target_latency = target_latency
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.timeout = timeout
+        self.dimension = None
+        self._lock = threading.Lock()
+        self._session = None
+        self._session_pid = None
+
+    @property
+    def session(self):
+        """Pooled HTTP session, recreated after a fork so workers never share sockets."""
+        if self._session is None or self._session_pid != os.getpid():
+            import requests
+            from requests.adapters import HTTPAdapter
+
+            session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+            session.mount("http://", adapter)
+            session.mount("https://", adapter)
+            self._session, self._session_pid = session, os.getpid()
+        return self._session
+
+    def _post_batch(self, texts):
+        """Embed one batch, retrying with backoff. Returns (vectors, latency)."""
+        import numpy as np
+        import requests
+
+        url = f"{self.base_url}/api/embed"
+        for attempt in range(self.max_retries + 1):
+            start = time.perf_counter()
+            try:
+                response = self.session.post(url, json={"model": self.model, "input": texts}, timeout=self.timeout)
+                response.raise_for_status()
+                vectors = np.asarray(response.json()["embeddings"], dtype=np.float32)
+                if vectors.ndim != 2 or vectors.shape[0] != len(texts):
+                    raise ValueError(f"expected {len(texts)} embeddings, got shape {vectors.shape}")
+                return vectors, time.perf_counter() - start
+            except (requests.RequestException, ValueError, KeyError) as e:
+                if attempt == self.max_retries:
+                    raise Exception(f"Embedding batch of {len(texts)} texts failed: {str(e)}")
+                delay = self.backoff_base * (2 ** attempt) * (0.5 + random.random())
+                print(f"[WARNING] Embedding batch failed ({str(e)}), retrying in {delay:.2f}s")
+                time.sleep(delay)
+
+    def _adapt(self, latency):
+        """Shrink the batch budget when batches are slow, grow it when fast."""
+        with self._lock:
+            if latency > self.target_latency:
+                self.batch_tokens = max(self.min_batch_tokens, self.batch_tokens // 2)
+            elif latency < self.target_latency / 2:
+                self.batch_tokens = min(self.max_batch_tokens, int(self.batch_tokens * 1.5))
+
+    def embed_matrix(self, texts: List[str], progress_callback=None):
+        """
+        Embed texts into a (len(texts), dim) float32 matrix.
+        
+        Args:
+            texts (List[str]): Texts to embed
+            progress_callback: Optional callable receiving the fraction of texts embedded
+        
+        Returns:
+            np.ndarray: Embeddings in the same order as texts
+        """
+        import numpy as np
+
+        n = len(texts)
+        if n == 0:
+            return np.empty((0, self.dimension or 0), dtype=np.float32)
+        token_counts = [_estimate_tokens(t) for t in texts]
+        pos = 0
+
+        def next_batch():
+            nonlocal pos
+            start, used = pos, 0
+            budget = self.batch_tokens
+            while pos < n and (pos == start or used + token_counts[pos] <= budget):
+                used += token_counts[pos]
+                pos += 1
+            return start, pos
+
+        # The first batch runs alone to learn the dimension and a first latency
+        start, end = next_batch()
+        vectors, latency = self._post_batch(texts[start:end])
+        self.dimension = vectors.shape[1]
+        matrix = np.empty((n, self.dimension), dtype=np.float32)
+        matrix[start:end] = vectors
+        self._adapt(latency)
+        completed = end - start
+        if progress_callback is not None:
+            progress_callback(completed / n)
+
+        pending = {}
+        with ThreadPoolExecutor(max_workers=self.max_concurrency) as executor:
+            try:
+                while pos < n or pending:
+                    while pos < n and len(pending) < self.max_concurrency:
+                        start, end = next_batch()
+                        pending[executor.submit(self._post_batch, texts[start:end])] = (start, end)
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        start, end = pending.pop(future)
+                        vectors, latency = future.result()
+                        matrix[start:end] = vectors
+                        self._adapt(latency)
+                        completed += end - start
+                        if progress_callback is not None:
+                            progress_callback(completed / n)
+            except Exception:
+                for future in pending:
+                    future.cancel()
+                raise
+
+        print(f"[INFO] Embedded {n} texts (batch budget now {self.batch_tokens} tokens)")
+        return matrix
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self.embed_matrix(texts).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_matrix([text])[0].tolist()
+
+def _make_vectorstore(index, store, embedding_model):
+    """
+    Wrap a FAISS index and a ChunkStore in a LangChain vector store.
+    
+    The store is read-only: add_texts, add_documents, delete and merge_from
+    raise TypeError (see retrieval.ReadOnlyFAISS). To change the chunks,
+    re-index the file with load_resume_and_create_retriever().
+    """
+    from langchain_core.embeddings import Embeddings
+    from retrieval import ReadOnlyFAISS
+
+    Embeddings.register(OllamaEmbeddingClient)
+    return ReadOnlyFAISS(
+        embedding_function=embedding_model,
+        index=index,
+        docstore=store,
+        index_to_docstore_id=store.id_map(),
+    )
+
+def _make_retriever(vectorstore, k=1):
+    """Retriever that prefilters by the query's resume sections before searching."""
+    from retrieval import ResumeRetriever
+
+    return ResumeRetriever(vectorstore=vectorstore, k=k, section_resolver=sections_for_query)
+
+def save_vectorstore(vectorstore, directory):
+    """
+    Persist a vector store built by load_resume_and_create_retriever().
+    
+    Writes the FAISS index (plus, for quantized storage, the full vectors)
+    and the columnar chunk store as flat files; the directory is replaced
+    atomically.
+    
+    Args:
+        vectorstore: FAISS vector store whose docstore is a ChunkStore
+        directory (str): Target directory
+    """
+    from quantize import write_index
+
+    tmp_dir = f"{directory}.tmp-{os.getpid()}-{threading.get_ident()}"
+    vectorstore.docstore.save(tmp_dir)
+    write_index(vectorstore.index, tmp_dir)
+    if os.path.exists(directory):
+        shutil.rmtree(directory)
+    os.replace(tmp_dir, directory)
+    print(f"[INFO] Saved index to {directory}")
+
+def load_vectorstore(directory, embedding_model=None):
+    """
+    Load a vector store saved with save_vectorstore().
+    
+    The chunk store (and, for quantized storage, the full vectors) is
+    memory-mapped, so no per-chunk objects are created until a search
+    returns them.
+    
+    Args:
+        directory (str): Directory written by save_vectorstore()
+        embedding_model: Embeddings for queries (default: OllamaEmbeddingClient)
+    """
+    from chunk_store import ChunkStore
+    from quantize import read_index
+
+    index = read_index(directory)
+    store = ChunkStore.load(directory)
+    print(f"[INFO] Loaded index with {len(store)} chunks from {directory}")
+    return _make_vectorstore(index, store, embedding_model or OllamaEmbeddingClient(model="nomic-embed-text"))
+
+def _report_progress(progress_callback, stage, fraction):
+    """Forward a progress update to the optional callback."""
+    if progress_callback is not None:
+        progress_callback(stage, fraction)
+
+# Chunks embedded and indexed per window while streaming
+EMBED_WINDOW = 512
+
+# Large enough that a resume entry (heading plus its paragraphs) is one chunk
+RESUME_CHUNK_SIZE = 1000
+
+def _embed_and_index(chunks, embedding_model, builder, fraction_of, progress_callback, window=EMBED_WINDOW,
+                     storage=None, vectors_path=None):
+    """
+    Embed an iterable of chunk Documents window by window.
+    
+    Each window is embedded, added to the FAISS index and appended to the
+    chunk store builder, then dropped, so only one window is held at a time.
+    With compressed storage (quantize.VectorStorage) the windows are written
+    to vectors_path instead, and the compressed index is built from that
+    file once all chunks are embedded.
+    
+    Returns:
+        The FAISS index (or quantize.QuantizedIndex), or None if there were
+        no non-empty chunks
+    """
+    import faiss
+    from quantize import FullVectorWriter, QuantizedIndex, build_index
+
+    compressed = storage is not None and storage.compressed
+    writer = FullVectorWriter(vectors_path) if compressed else None
+    index = None
+    batch = []
+    count = 0
+
+    def flush():
+        nonlocal index
+        matrix = embedding_model.embed_matrix([doc.page_content for doc in batch])
+        if writer is not None:
+            writer.add(matrix)
+        else:
+            if index is None:
+                index = faiss.IndexFlatL2(matrix.shape[1])
+            index.add(matrix)
+        builder.add_documents(batch)
+        _report_progress(progress_callback, "embed", 0.15 + 0.8 * fraction_of(batch[-1], count))
+        batch.clear()
+
+    for doc in chunks:
+        if not doc.page_content.strip():
+            continue
+        batch.append(doc)
+        count += 1
+        if len(batch) >= window:
+            flush()
+    if batch:
+        flush()
+    if writer is not None and writer.rows:
+        full_vectors = writer.finish()
+        index = QuantizedIndex(build_index(full_vectors, storage), full_vectors, storage)
+        print(f"[INFO] Stored {index.ntotal} vectors as {storage.cache_tag()}: "
+              f"{index.nbytes / 2**20:.1f} MiB in memory, {full_vectors.nbytes / 2**20:.1f} MiB on disk")
+    return index
+
+def load_resume_and_create_retriever(file_path, progress_callback=None, store_dir=None, storage=None):
+    """
+    Extract, split, embed and index a resume file.
+    
+    .txt files are streamed: chunks are embedded in windows as they are read,
+    so apart from the vectors only one window of chunk text is in memory at a
+    time (none at all once built, when store_dir is given).
+    
+    Args:
+        file_path (str): Path to a .pdf or .txt file
+        progress_callback: Optional callable receiving (stage, fraction) where
+            stage is one of "extract", "split", "embed", "index" and fraction
+            is the overall progress between 0.0 and 1.0
+        store_dir (str): Optional directory to stream chunk texts (and full
+            vectors, for compressed storage) into instead of keeping them in memory
+        storage (quantize.VectorStorage): How vectors are stored in memory
+            (default: from VECTOR_STORAGE / VECTOR_DIMS, float32 if unset)
+    
+    Returns:
+        A retriever over the indexed chunks
+    """
+    from chunk_store import ChunkStoreBuilder
+    from quantize import VECTORS_FILE, VectorStorage
+
     if not os.path.exists(file_path):
         raise FileNotFoundError(f"File not found: {file_path}")
     print(f"[INFO] Loading file: {file_path}")
+    _report_progress(progress_callback, "extract", 0.0)
 
     ext = os.path.splitext(file_path)[1].lower()
     if ext == ".txt":
-        docs = extract_text_from_txt(file_path)
+        # Stream chunks straight into embedding; progress follows the byte offset
+        file_size = max(1, os.path.getsize(file_path))
+        chunks = iter_txt_chunks(file_path, chunk_size=RESUME_CHUNK_SIZE)
+        fraction_of = lambda doc, count: doc.metadata["start_byte"] / file_size
     elif ext == ".pdf":
         text_content = extract_text_from_pdf_stream(file_path)
-        docs = [Document(page_content=text, metadata={"source": file_path, "page": i+1}) for i, text in enumerate(text_content)]
+        print(f"[INFO] Loaded {len(text_content)} page(s) with content")
+        _report_progress(progress_callback, "split", 0.1)
+        chunks = []
+        for i, text in enumerate(text_content):
+            # Sections run on across page breaks
+            heading = chunks[-1].metadata.get("heading") if chunks else None
+            chunks.extend(split_resume_page(text, {"source": file_path, "page": i+1},
+                                            chunk_size=RESUME_CHUNK_SIZE, heading=heading))
+        total = max(1, len(chunks))
+        fraction_of = lambda doc, count: count / total
     else:
         raise ValueError("Unsupported file type. Please upload a .pdf or .txt file.")
 
-    print(f"[INFO] Loaded {len(docs)} document(s) with content")
-
-    splitter = RecursiveCharacterTextSplitter(chunk_size=500, chunk_overlap=50)
-    chunks = splitter.split_documents(docs)
-    chunks = [c for c in chunks if c.page_content.strip()]
-    print(f"[INFO] Split into {len(chunks)} chunks")
-
-    embedding_model = OllamaEmbeddings(model="nomic-embed-text")
+    embedding_model = OllamaEmbeddingClient(model="nomic-embed-text")
+    builder = ChunkStoreBuilder(store_dir)
+    storage = storage or VectorStorage.from_env()
+    vectors_path = os.path.join(store_dir, VECTORS_FILE) if store_dir else None
     print("[INFO] Creating vector store embeddings...")
-    vectorstore = FAISS.from_documents(chunks, embedding_model)
+    index = _embed_and_index(chunks, embedding_model, builder, fraction_of, progress_callback,
+                             storage=storage, vectors_path=vectors_path)
+    print(f"[INFO] Split into {len(builder)} chunks")
+    if index is None:
+        raise ValueError("No text chunks to index.")
 
-    retriever = vectorstore.as_retriever(search_kwargs={"k": 1})
+    _report_progress(progress_callback, "index", 0.95)
+    vectorstore = _make_vectorstore(index, builder.build(), embedding_model)
+    retriever = _make_retriever(vectorstore)
     print("[INFO] Retriever created successfully")
+    _report_progress(progress_callback, "index", 1.0)
     
     return retriever
 
-def ask(query, retriever=None, file_path="AS_KB.txt", model="mistral"):
+# Retrievers built from files on disk, keyed by (absolute path, mtime), and
+# retrievers registered under an explicit index id (e.g. by ingestion jobs).
+_retriever_cache = {}
+_retriever_registry = {}
+_retriever_lock = threading.Lock()
+
+# Built indexes are persisted here so restarts skip re-embedding unchanged files.
+# Bump _INDEX_FORMAT_VERSION whenever chunking or embedding changes.
+INDEX_CACHE_DIR = os.environ.get("RESUME_INDEX_CACHE_DIR", ".index_cache")
+_INDEX_FORMAT_VERSION = 3
+
+def _index_cache_path(file_path, mtime_ns):
+    from quantize import VectorStorage
+
+    digest = hashlib.sha1(os.path.abspath(file_path).encode("utf-8")).hexdigest()[:16]
+    name = f"{os.path.basename(file_path)}-{digest}-{mtime_ns}-v{_INDEX_FORMAT_VERSION}"
+    storage = VectorStorage.from_env()
+    if storage.compressed:
+        name += f"-{storage.cache_tag()}"
+    return os.path.join(INDEX_CACHE_DIR, name)
+
+def get_retriever(file_path="AS_KB.txt", client_id=None):
+    """
+    Return a cached retriever for a file, building it on first use.
+    
+    The cache is keyed on the file's modification time, so an edited file
+    is re-indexed on the next call. Built indexes are also saved under
+    INDEX_CACHE_DIR and reloaded from there after a restart. Builds wait
+    for a slot in ratelimit.index_build_queue.
+    
+    Args:
+        file_path (str): Path to the resume file
+        client_id (str): Caller, for fair scheduling of index builds
+    
+    Returns:
+        A retriever over the file's chunks
+    
+    Raises:
+        ratelimit.QueueFullError: If no index build slot frees up in time
+    """
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(f"File not found: {file_path}")
+    mtime_ns = os.stat(file_path).st_mtime_ns
+    key = (os.path.abspath(file_path), mtime_ns)
+    with _retriever_lock:
+        retriever = _retriever_cache.get(key)
+    if retriever is None:
+        cache_path = _index_cache_path(file_path, mtime_ns)
+        from ratelimit import index_build_queue
+
+        index_path = os.path.join(cache_path, "index.faiss")
+        if os.path.exists(index_path):
+            retriever = _make_retriever(load_vectorstore(cache_path))
+        else:
+            with index_build_queue.slot(client_id or "local"):
+                # Another request may have built it while this one waited
+                with _retriever_lock:
+                    retriever = _retriever_cache.get(key)
+                if retriever is None and os.path.exists(index_path):
+                    retriever = _make_retriever(load_vectorstore(cache_path))
+                if retriever is None:
+                    retriever = _build_and_cache(file_path, cache_path)
+        with _retriever_lock:
+            retriever = _retriever_cache.setdefault(key, retriever)
+    return retriever
+
+def _build_and_cache(file_path, cache_path):
+    """
+    Build a retriever for file_path and save its index under cache_path.
+    
+    The entry is built in a private temporary directory next to cache_path
+    and renamed into place once complete, so other processes never see (or
+    truncate) a half-written entry. If another process renames its entry
+    into place first, that one is loaded and this build is discarded.
+    """
+    from quantize import write_index
+
+    tmp_path = f"{cache_path}.tmp-{os.getpid()}-{threading.get_ident()}"
+    try:
+        shutil.rmtree(tmp_path, ignore_errors=True)
+        os.makedirs(tmp_path)
+    except OSError as e:
+        print(f"[WARNING] Could not cache index for {file_path}: {str(e)}")
+        tmp_path = None
+    retriever = load_resume_and_create_retriever(file_path, store_dir=tmp_path)
+    if tmp_path is None:
+        return retriever
+
+    try:
+        write_index(retriever.vectorstore.index, tmp_path)
+        if os.path.isdir(cache_path) and not os.path.exists(os.path.join(cache_path, "index.faiss")):
+            # Left behind incomplete by an interrupted build
+            shutil.rmtree(cache_path, ignore_errors=True)
+        os.rename(tmp_path, cache_path)
+        # Open files (memory-mapped chunk texts and vectors) follow the rename
+        return retriever
+    except (OSError, RuntimeError) as e:
+        if os.path.exists(os.path.join(cache_path, "index.faiss")):
+            print(f"[INFO] Index for {file_path} was cached by another process, loading it")
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            return _make_retriever(load_vectorstore(cache_path))
+        print(f"[WARNING] Could not cache index for {file_path}: {str(e)}")
+        return retriever
+
+def register_retriever(index_id, retriever):
+    """Make a retriever queryable under the given index id."""
+    with _retriever_lock:
+        _retriever_registry[index_id] = retriever
+    print(f"[INFO] Registered index '{index_id}'")
+
+def unregister_retriever(index_id):
+    """Forget a registered retriever and its cached answers. Returns True if it was registered."""
+    with _retriever_lock:
+        retriever = _retriever_registry.pop(index_id, None)
+    if retriever is None:
+        return False
+    _forget_answers(retriever.index_uuid)
+    print(f"[INFO] Unregistered index '{index_id}'")
+    return True
+
+def get_registered_retriever(index_id):
+    """
+    Look up a retriever registered with register_retriever().
+    
+    Raises:
+        KeyError: If no index is registered under index_id
+    """
+    with _retriever_lock:
+        if index_id not in _retriever_registry:
+            raise KeyError(f"Unknown index: {index_id}")
+        return _retriever_registry[index_id]
+
+# Default Ollama model, shared by ask(), ask_with_sources() and the APIs
+DEFAULT_MODEL = os.environ.get("DEFAULT_MODEL", "llama3")
+
+def _generate_answer(processed_query, retriever, model, return_sources=True):
+    """
+    Run the RetrievalQA chain for an already preprocessed query.
+    
+    Raises on failure; ask() and ask_with_sources() turn errors into messages.
+    
+    Returns:
+        tuple: (answer, source_documents)
+    """
+    from langchain.chains import RetrievalQA
+    from langchain_community.llms import Ollama
+
+    print(f"[INFO] Creating QA chain with model: {model}")
+    qa_chain = RetrievalQA.from_chain_type(
+        llm=Ollama(model=model),
+        retriever=retriever,
+        return_source_documents=return_sources
+    )
+    
+    print(f"[INFO] Processing preprocessed query: {processed_query}")
+    result = qa_chain.invoke({"query": processed_query})
+    return result["result"], result.get("source_documents", [])
+
+def ask(query, retriever=None, file_path="AS_KB.txt", model=DEFAULT_MODEL):
     """
     Ask a question and get a response based on the resume content.
     
@@ -309,19 +1244,10 @@ def ask(query, retriever=None, file_path="AS_KB.txt", model="mistral"):
         # Load retriever if not provided
         if retriever is None:
             print(f"[INFO] Loading retriever from {file_path}")
-            retriever = load_resume_and_create_retriever(file_path)
-        
-        # Create QA chain
-        print(f"[INFO] Creating QA chain with model: {model}")
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=Ollama(model=model),
-            retriever=retriever,
-            return_source_documents=False
-        )
+            retriever = get_retriever(file_path)
         
         # Get response with processed query
-        print(f"[INFO] Processing preprocessed query: {processed_query}")
-        response = qa_chain.run(processed_query)
+        response, _ = _generate_answer(processed_query, retriever, model, return_sources=False)
         print(f"[INFO] Response generated successfully")
         
         return response
@@ -331,7 +1257,7 @@ def ask(query, retriever=None, file_path="AS_KB.txt", model="mistral"):
         print(f"[ERROR] {error_msg}")
         return f"Sorry, I encountered an error while processing your question: {str(e)}"
 
-def ask_with_sources(query, retriever=None, file_path="AS_KB.txt", model="mistral"):
+def ask_with_sources(query, retriever=None, file_path="AS_KB.txt", model=DEFAULT_MODEL):
     """
     Ask a question and get a response with source documents.
     
@@ -355,21 +1281,10 @@ def ask_with_sources(query, retriever=None, file_path="AS_KB.txt", model="mistra
         # Load retriever if not provided
         if retriever is None:
             print(f"[INFO] Loading retriever from {file_path}")
-            retriever = load_resume_and_create_retriever(file_path)
-        
-        # Create QA chain that returns source documents
-        print(f"[INFO] Creating QA chain with model: {model}")
-        qa_chain = RetrievalQA.from_chain_type(
-            llm=Ollama(model=model),
-            retriever=retriever,
-            return_source_documents=True
-        )
+            retriever = get_retriever(file_path)
         
         # Get response with sources using processed query
-        print(f"[INFO] Processing preprocessed query: {processed_query}")
-        result = qa_chain({"query": processed_query})
-        answer = result["result"]
-        source_documents = result["source_documents"]
+        answer, source_documents = _generate_answer(processed_query, retriever, model)
         
         print(f"[INFO] Response generated successfully with {len(source_documents)} source documents")
         
@@ -379,3 +1294,450 @@ def ask_with_sources(query, retriever=None, file_path="AS_KB.txt", model="mistra
         error_msg = f"Error processing query: {str(e)}"
         print(f"[ERROR] {error_msg}")
         return f"Sorry, I encountered an error while processing your question: {str(e)}", []
+
+# Extractive answers: sentences picked straight from the retrieved chunks
+EXTRACTIVE_K = 3
+EXTRACTIVE_CONFIDENCE = 0.6
+ANSWER_MODES = ("auto", "generate", "extractive")
+MODEL_CHOICES = ("auto", *SUPPORTED_MODELS)
+# Credit for a query word matched only through a section synonym ("study" by "university")
+EXTRACTIVE_SYNONYM_WEIGHT = 0.5
+EXTRACTIVE_NOT_FOUND = "I couldn't find that in the resume."
+
+def validate_answer_options(model, slo_ms, answer_mode):
+    """
+    Check the per-request options of answer_query() and ask_in_session().
+    
+    Args:
+        model (str): Requested model; None or "auto" lets the router pick
+        slo_ms: Latency budget in milliseconds, as a number or numeric string, or None
+        answer_mode (str): One of ANSWER_MODES
+    
+    Returns:
+        float: slo_ms as a float, or None if no budget was given
+    
+    Raises:
+        ValueError: With a message suitable for a 400 response
+    """
+    if model not in (None, *MODEL_CHOICES):
+        raise ValueError(f"'model' must be one of {', '.join(MODEL_CHOICES)}")
+    if answer_mode not in ANSWER_MODES:
+        raise ValueError(f"'answer_mode' must be one of {', '.join(ANSWER_MODES)}")
+    if slo_ms is None or slo_ms == "":
+        return None
+    message = "'slo_ms' must be a non-negative number of milliseconds"
+    if isinstance(slo_ms, bool) or not isinstance(slo_ms, (int, float, str)):
+        raise ValueError(message)
+    try:
+        slo_ms = float(slo_ms)
+    except ValueError:
+        raise ValueError(message) from None
+    # Also rejects NaN
+    if not 0 <= slo_ms < math.inf:
+        raise ValueError(message)
+    return slo_ms
+
+_STOPWORDS = {
+    "a", "an", "the", "is", "are", "was", "were", "be", "been", "do", "does", "did", "has", "have",
+    "had", "what", "which", "who", "whom", "where", "when", "why", "how", "he", "she", "they", "his",
+    "her", "their", "him", "it", "its", "of", "in", "on", "at", "to", "for", "with", "about", "from",
+    "by", "and", "or", "me", "tell", "can", "you", "any", "some", "there", "this", "that", "know", "s",
+}
+
+def _normalize_term(word: str) -> str:
+    word = word.lower()
+    return word[:-1] if len(word) > 3 and word.endswith("s") else word
+
+def _query_term_groups(query: str) -> List[tuple]:
+    """
+    Group the query's content words with their acceptable synonyms.
+    
+    A word that triggers a section in QUERY_SECTION_KEYWORDS is also matched
+    by that section's other terms (so "study" is answered by "university"),
+    at EXTRACTIVE_SYNONYM_WEIGHT; other words only match themselves.
+    
+    Returns:
+        List[tuple]: (normalized word, frozenset of normalized synonyms) pairs
+    """
+    words = [w for w in re.findall(r"[a-z0-9+#]+", query.lower()) if w not in _STOPWORDS]
+    words += [k.lower() for k in extract_keywords(query) if k.lower() not in words]
+    groups = []
+    for word in words:
+        term = _normalize_term(word)
+        synonyms = set()
+        for _, terms in QUERY_SECTION_KEYWORDS.values():
+            if word in terms:
+                synonyms.update(_normalize_term(t) for t in terms)
+        synonyms.discard(term)
+        group = (term, frozenset(synonyms))
+        if group not in groups:
+            groups.append(group)
+    return groups
+
+def _search_with_scores(retriever, query, k, vector=None):
+    """Retrieve (Document, similarity) pairs; similarity is 1 / (1 + L2 distance)."""
+    if hasattr(retriever, "search_with_scores"):
+        hits = retriever.search_with_scores(query, k=k, vector=vector)
+        return [(doc, 1.0 / (1.0 + distance)) for doc, distance in hits]
+    return [(doc, 1.0) for doc in retriever.invoke(query)[:k]]
+
+def extractive_answer(query, scored_docs, max_sentences=2):
+    """
+    Build an answer from the best-matching sentences of retrieved chunks.
+    
+    Sentences are scored by how many of the query's words they contain
+    (a synonym counts EXTRACTIVE_SYNONYM_WEIGHT of an exact match, see
+    _query_term_groups; words common to most retrieved sentences count
+    less) weighted by their chunk's vector similarity
+    relative to the best chunk. If no sentence contains any query word the
+    answer is EXTRACTIVE_NOT_FOUND with confidence 0.
+    
+    Args:
+        query (str): Preprocessed user query
+        scored_docs (list): (Document, similarity) pairs, best first
+        max_sentences (int): Maximum sentences in the answer
+    
+    Returns:
+        dict: "answer" (str), "confidence" (0-1) and "sources" (the
+        Documents the sentences came from, in retrieval order)
+    """
+    groups = _query_term_groups(query)
+    best_similarity = max((score for _, score in scored_docs), default=0.0) or 1.0
+    sentences = []
+    for doc_rank, (doc, similarity) in enumerate(scored_docs):
+        heading = doc.metadata.get("heading")
+        for sentence in re.split(r"(?<=[.!?])\s+|\n+", doc.page_content):
+            sentence = sentence.strip()
+            if sentence and sentence != heading:
+                terms = {_normalize_term(w) for w in re.findall(r"[A-Za-z0-9+#]+", sentence)}
+                sentences.append((doc_rank, similarity / best_similarity, sentence, terms))
+
+    # Smoothed IDF over the retrieved sentences, so a word found in nearly
+    # all of them (the candidate's name) adds little to the coverage
+    weights = [1.0 + math.log((1 + len(sentences)) / (1 + sum(term in t for *_, t in sentences)))
+               for term, _ in groups]
+    total_weight = sum(weights)
+    candidates = []
+    for doc_rank, relative, sentence, terms in sentences:
+        matched = sum(weight * (1.0 if term in terms else EXTRACTIVE_SYNONYM_WEIGHT if synonyms & terms else 0.0)
+                      for weight, (term, synonyms) in zip(weights, groups))
+        coverage = matched / total_weight if total_weight else 0.0
+        candidates.append((coverage * (0.5 + 0.5 * relative), doc_rank, sentence))
+
+    candidates.sort(key=lambda c: -c[0])
+    best = [c for c in candidates[:max_sentences] if c[0] > 0]
+    if not best:
+        return {"answer": EXTRACTIVE_NOT_FOUND, "confidence": 0.0, "sources": []}
+    used = sorted({doc_rank for _, doc_rank, _ in best})
+    return {
+        "answer": " ".join(sentence for _, _, sentence in best),
+        "confidence": round(best[0][0], 3),
+        "sources": [scored_docs[i][0] for i in used],
+    }
+
+# Recently generated answers, keyed by (retriever index_uuid, preprocessed
+# query), served when every model is over its latency budget
+ANSWER_CACHE_SIZE = 512
+_answer_cache = OrderedDict()
+_answer_cache_lock = threading.Lock()
+
+def _cached_answer(key):
+    with _answer_cache_lock:
+        entry = _answer_cache.get(key)
+        if entry is not None:
+            _answer_cache.move_to_end(key)
+        return entry
+
+def _cache_answer(key, answer, sources, model):
+    with _answer_cache_lock:
+        _answer_cache[key] = (answer, sources, model)
+        _answer_cache.move_to_end(key)
+        while len(_answer_cache) > ANSWER_CACHE_SIZE:
+            _answer_cache.popitem(last=False)
+
+def _forget_answers(index_uuid):
+    with _answer_cache_lock:
+        for key in [key for key in _answer_cache if key[0] == index_uuid]:
+            del _answer_cache[key]
+
+@contextmanager
+def _generation_slot(model, client_id, slo):
+    """
+    Hold a generation_queue slot and track the generation in the router.
+    
+    While waiting for the slot the request counts towards the model's queue
+    depth (router.ModelRouter.queued), so routing decisions see queued
+    requests and not just the ones Ollama is already running.
+    """
+    from ratelimit import generation_queue
+    from router import model_router
+
+    client = client_id or "local"
+    with model_router.queued(model):
+        generation_queue.acquire(client, timeout=slo)
+    try:
+        with model_router.track(model):
+            yield
+    finally:
+        generation_queue.release(client)
+
+def answer_query(query, retriever=None, file_path="AS_KB.txt", model="auto", slo_ms=None, answer_mode="auto", client_id=None):
+    """
+    Answer a question with the model picked by the router.
+    
+    The router (router.model_router) looks at each model's queue depth and
+    observed latency. If the requested model cannot meet slo_ms, the request
+    falls back to the smaller model, then to a cached answer for the same
+    question, then to an extractive answer. Generations wait for a slot in
+    ratelimit.generation_queue, which is shared fairly between clients.
+    
+    Args:
+        query (str): The question to ask
+        retriever: Optional pre-loaded retriever. If None, will load from file_path
+        file_path (str): Path to the resume file (default: "AS_KB.txt")
+        model (str): Preferred Ollama model, or "auto" to let the router pick
+        slo_ms (float): Optional per-request latency budget in milliseconds
+        answer_mode (str): "generate" (always use the LLM), "extractive"
+            (never use it) or "auto" (extractive when its confidence reaches
+            EXTRACTIVE_CONFIDENCE, otherwise generate)
+        client_id (str): Caller, for fair scheduling (see ratelimit.py)
+    
+    Returns:
+        dict: "answer", "sources" (Documents), "model" (what served the
+        answer: a model name, "cache:<model>" or "extractive"),
+        "requested_model" and "route" (reason for the choice)
+    
+    Raises:
+        ratelimit.QueueFullError: If the generation or index build queue is
+            full or timed out (with slo_ms set, a full generation queue
+            falls back to the cached answer, or to the extractive answer
+            unless answer_mode is "generate")
+        ValueError: If model, slo_ms or answer_mode is invalid (see
+            validate_answer_options())
+    """
+    from ratelimit import QueueFullError
+    from router import model_router
+
+    slo_ms = validate_answer_options(model, slo_ms, answer_mode)
+
+    print(f"[INFO] Original query: '{query}'")
+    processed_query = preprocess_query(query)
+    if retriever is None:
+        print(f"[INFO] Loading retriever from {file_path}")
+        retriever = get_retriever(file_path, client_id=client_id)
+
+    def result(answer, sources, served_by, reason):
+        return {
+            "answer": answer,
+            "sources": sources,
+            "model": served_by,
+            "requested_model": model,
+            "route": reason,
+        }
+
+    # One search serves both the extractive answer and the generation prompt
+    scored_docs = None
+    extract = None
+    if answer_mode in ("auto", "extractive"):
+        scored_docs = _search_with_scores(retriever, processed_query, EXTRACTIVE_K)
+        extract = extractive_answer(processed_query, scored_docs)
+        print(f"[INFO] Extractive answer confidence: {extract['confidence']}")
+        if answer_mode == "extractive" or (extract["answer"] and extract["confidence"] >= EXTRACTIVE_CONFIDENCE):
+            reason = "extractive answer requested" if answer_mode == "extractive" else f"extractive answer (confidence {extract['confidence']})"
+            return result(extract["answer"], extract["sources"], "extractive", reason)
+
+    cache_key = (retriever.index_uuid, processed_query)
+    cached = _cached_answer(cache_key)
+    slo = slo_ms / 1000.0 if slo_ms else None
+    decision = model_router.choose(model, slo, has_cached=cached is not None,
+                                   has_extractive=(answer_mode != "generate"))
+    print(f"[INFO] Routing to {decision.model} ({decision.reason})")
+
+    if decision.model == "cache":
+        answer, sources, cached_model = cached
+        return result(answer, sources, f"cache:{cached_model}", decision.reason)
+    if decision.model == "extractive":
+        return result(extract["answer"], extract["sources"], "extractive", decision.reason)
+
+    if scored_docs is None:
+        scored_docs = _search_with_scores(retriever, processed_query, EXTRACTIVE_K)
+    # As in ask_in_session(), the prompt gets the best EXTRACTIVE_K chunks' text
+    sources = [doc for doc, _ in scored_docs]
+    try:
+        with _generation_slot(decision.model, client_id, slo):
+            answer = _generate_from_documents(processed_query, sources, decision.model)
+    except QueueFullError as e:
+        if slo is None:
+            raise
+        print(f"[WARNING] {str(e)}, falling back")
+        if cached is not None:
+            answer, sources, cached_model = cached
+            return result(answer, sources, f"cache:{cached_model}", f"{str(e)}, serving cached answer")
+        if answer_mode == "generate":
+            raise
+        return result(extract["answer"], extract["sources"], "extractive", f"{str(e)}, serving extractive answer")
+    _cache_answer(cache_key, answer, sources, decision.model)
+    return result(answer, sources, decision.model, decision.reason)
+
+# Sessions: follow-ups whose query embedding is at least this similar to the
+# previous turn's reuse its chunks instead of searching again
+SESSION_REUSE_SIMILARITY = 0.85
+
+# Words that make a short question refer back to the previous turn
+_FOLLOW_UP_WORDS = {"it", "that", "those", "this", "these", "there", "them", "more", "else", "also", "then"}
+
+SESSION_PROMPT = """Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+Conversation so far:
+{history}
+
+Context:
+{context}
+
+Question: {question}
+Helpful Answer:"""
+
+# The same prompt without a conversation, for answer_query()
+ANSWER_PROMPT = """Use the following pieces of context to answer the question at the end. If you don't know the answer, just say that you don't know, don't try to make up an answer.
+
+{context}
+
+Question: {question}
+Helpful Answer:"""
+
+def _generate_from_documents(question, documents, model, history=None):
+    """
+    Answer from the given chunks with a single LLM call.
+    
+    Args:
+        question (str): Preprocessed query
+        documents (list): Chunks to answer from
+        model (str): Ollama model
+        history (str): Conversation so far, or None outside a session
+    """
+    from langchain_community.llms import Ollama
+
+    context = "\n\n".join(doc.page_content for doc in documents)
+    if history is None:
+        prompt = ANSWER_PROMPT.format(context=context, question=question)
+    else:
+        prompt = SESSION_PROMPT.format(history=history or "(none)", context=context, question=question)
+    print(f"[INFO] Generating answer with {model} (~{_estimate_tokens(prompt)} prompt tokens)")
+    return Ollama(model=model).invoke(prompt)
+
+def _is_follow_up(processed_query):
+    words = re.findall(r"[a-z]+", processed_query)
+    return len(words) <= 8 and any(w in _FOLLOW_UP_WORDS for w in words)
+
+def ask_in_session(session_id, query, retriever=None, file_path="AS_KB.txt", model="auto", slo_ms=None, answer_mode="auto",
+                   client_id=None):
+    """
+    Answer a question as part of a conversation.
+    
+    The session keeps a token-budgeted history of earlier turns that is
+    included in the prompt. If the query embedding is close to the previous
+    turn's, that turn's chunks are reused without searching; short follow-ups
+    like "what else did he do there?" are searched together with the
+    previous question. Idle sessions expire (see sessions.session_store).
+    
+    Args:
+        session_id (str): Session to continue, or None to start a new one
+        query (str): The question to ask
+        retriever: Optional pre-loaded retriever. If None, will load from file_path
+        file_path (str): Path to the resume file (default: "AS_KB.txt")
+        model (str): Preferred Ollama model, or "auto" to let the router pick
+        slo_ms (float): Optional per-request latency budget in milliseconds
+        answer_mode (str): "generate", "extractive" or "auto", as in answer_query()
+        client_id (str): Caller, for fair scheduling (see ratelimit.py)
+    
+    Returns:
+        dict: Same keys as answer_query(), plus "session_id" and
+        "reused_context" (True if the previous turn's chunks were reused)
+    
+    Raises:
+        ratelimit.QueueFullError: As in answer_query()
+        ValueError: As in answer_query()
+    """
+    from ratelimit import QueueFullError
+    from router import model_router
+    from sessions import session_store
+
+    slo_ms = validate_answer_options(model, slo_ms, answer_mode)
+
+    session = session_store.get_or_create(session_id)
+    print(f"[INFO] Session {session.id} turn {session.turns + 1}: '{query}'")
+    processed_query = preprocess_query(query)
+    if retriever is None:
+        retriever = get_retriever(file_path, client_id=client_id)
+
+    with session.lock:
+        vector = None
+        reused = False
+        if hasattr(retriever, "embed_query") and hasattr(retriever, "search_with_scores"):
+            vector = retriever.embed_query(processed_query)
+            # Only reuse chunks from the same index: another retriever has
+            # different chunks, and possibly a different embedding dimension
+            if (session.last_vector is not None and session.last_sources
+                    and session.last_retriever_id == retriever.index_uuid
+                    and session.last_vector.shape == vector.shape):
+                a, b = vector[0], session.last_vector[0]
+                similarity = float(a @ b / ((a @ a) ** 0.5 * (b @ b) ** 0.5 or 1.0))
+                reused = similarity >= SESSION_REUSE_SIMILARITY
+                print(f"[DEBUG] Similarity to previous turn: {similarity:.3f}")
+
+        if reused:
+            scored_docs = session.last_sources
+        else:
+            search_query = processed_query
+            if session.last_query and _is_follow_up(processed_query):
+                search_query = f"{session.last_query} {processed_query}"
+                vector = None
+            scored_docs = _search_with_scores(retriever, search_query, EXTRACTIVE_K, vector=vector)
+            if vector is None and hasattr(retriever, "embed_query"):
+                vector = retriever.embed_query(processed_query)
+
+        history = session.history()
+        extract = None
+        served_by = reason = None
+        if answer_mode in ("auto", "extractive"):
+            extract = extractive_answer(processed_query, scored_docs)
+            if answer_mode == "extractive" or (extract["answer"] and extract["confidence"] >= EXTRACTIVE_CONFIDENCE):
+                answer, sources = extract["answer"], extract["sources"]
+                served_by = "extractive"
+                reason = "extractive answer requested" if answer_mode == "extractive" else f"extractive answer (confidence {extract['confidence']})"
+
+        if served_by is None:
+            slo = slo_ms / 1000.0 if slo_ms else None
+            decision = model_router.choose(model, slo, has_extractive=(answer_mode != "generate"))
+            print(f"[INFO] Routing to {decision.model} ({decision.reason})")
+            served_by, reason = decision.model, decision.reason
+            if decision.model != "extractive":
+                # The generation prompt gets the best EXTRACTIVE_K chunks' text only
+                sources = [doc for doc, _ in scored_docs]
+                try:
+                    with _generation_slot(decision.model, client_id, slo):
+                        answer = _generate_from_documents(processed_query, sources, decision.model, history)
+                except QueueFullError as e:
+                    if slo is None or answer_mode == "generate":
+                        raise
+                    print(f"[WARNING] {str(e)}, falling back")
+                    served_by, reason = "extractive", f"{str(e)}, serving extractive answer"
+            if served_by == "extractive":
+                extract = extract or extractive_answer(processed_query, scored_docs)
+                answer, sources = extract["answer"], extract["sources"]
+
+        session.add_turn(query, answer)
+        session.last_query = processed_query
+        session.last_vector = vector
+        session.last_sources = scored_docs
+        session.last_retriever_id = retriever.index_uuid
+
+    return {
+        "answer": answer,
+        "sources": sources,
+        "model": served_by,
+        "requested_model": model,
+        "route": reason,
+        "session_id": session.id,
+        "reused_context": reused,
+    }